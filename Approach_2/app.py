@@ -1,9 +1,18 @@
+import os
+import sys
 import streamlit as st
-import fitz  # PyMuPDF
 import openai
-import re
 import logging
-import hashlib
+
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extraction_cache import extract_with_cache, get_default_cache
+from llm_cache import get_llm_cache
+from app_state import show_metrics_panel
+from near_duplicates import NearDuplicateIndex, DEFAULT_THRESHOLD
+from screening import (screen_papers, RateLimiter, DEFAULT_CONCURRENCY, DEFAULT_RPM, DEFAULT_TPM, TRIAGE_MODEL,
+                       DEFAULT_EXCLUDE_CONFIDENCE, DEFAULT_INCLUDE_CONFIDENCE)
+from batched_screening import screen_papers_batched, DEFAULT_BATCH_PAPERS, DEFAULT_BATCH_TOKENS
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -34,18 +43,12 @@ def extract_text_from_pdf(pdf_file):
     try:
         logger.info(f"Extracting text from: {pdf_file.name}")
 
-        # Open the PDF file directly from the uploaded stream
-        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        extracted_text = ""
-
-        for page in doc:
-            blocks = page.get_text("blocks")
-            sorted_blocks = sorted(blocks, key=lambda b: (b[1], b[0]))  # Sort by Y, then X position
+        # PyMuPDF blocks sorted by Y, then X position, served from the shared extraction cache
+        extracted_text, cache_hit = extract_with_cache(pdf_file, "pymupdf_blocks")
+        if cache_hit:
+            logger.info(f"Extraction cache hit: {pdf_file.name}")
 
-            for block in sorted_blocks:
-                extracted_text += block[4] + "\n"  # The actual text content
-
-        return extracted_text.strip() if extracted_text.strip() else "No extractable text found."
+        return extracted_text if extracted_text else "No extractable text found."
 
     except Exception as e:
         logger.error(f"Error extracting text from {pdf_file.name}: {e}")
@@ -53,60 +56,40 @@ def extract_text_from_pdf(pdf_file):
         return ""
 
 # Function to check for duplicate PDFs based on text content
-def is_duplicate(text, seen_texts):
-    """ Check if extracted text is a duplicate using a hash. """
-    text_hash = hashlib.md5(text.encode()).hexdigest()
-    if text_hash in seen_texts:
-        return True
-    seen_texts.add(text_hash)
-    return False
-
-# Function to call OpenAI once per unique paper
-def process_paper_with_openai(text, criteria):
-    try:
-        logger.info("Calling OpenAI for title, abstract, and inclusion evaluation...")
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "system", 
-                "content": "You are an AI assistant that extracts title and abstract from research papers and evaluates inclusion criteria."
-            }, {
-                "role": "user", 
-                "content": f"Extract the title and abstract from the following research paper text. Then, analyze the full text to determine whether the paper meets the inclusion criteria.\n\n"
-                           f"Paper Text:\n{text}\n\n"
-                           f"Inclusion Criteria: {criteria}\n\n"
-                           f"Format your response as:\n"
-                           f"Title: <title>\n"
-                           f"Abstract: <abstract>\n"
-                           f"Decision: <Include/Exclude>\n"
-                           f"Reason: <brief reason>"
-            }]
-        )
-        content = response["choices"][0]["message"]["content"]
-
-        # Extract information
-        title_match = re.search(r"(?i)Title:\s*(.+)", content)
-        abstract_match = re.search(r"(?i)Abstract:\s*(.+)", content, re.DOTALL)
-        decision_match = re.search(r"(?i)Decision:\s*(Include|Exclude)", content)
-        reason_match = re.search(r"(?i)Reason:\s*(.+)", content, re.DOTALL)
-
-        title = title_match.group(1).strip() if title_match else "Title not found"
-        abstract = abstract_match.group(1).strip() if abstract_match else "Abstract not found"
-        decision = decision_match.group(1) if decision_match else "Error"
-        reason = reason_match.group(1).strip() if reason_match else "No reason provided"
-
-        logger.info(f"OpenAI processed paper: {title}")
-        return title, abstract, decision, reason
-
-    except Exception as e:
-        logger.error(f"Error processing paper with OpenAI: {e}")
-        st.error(f"❌ Error processing paper with OpenAI: {e}")
-        return "Title not found", "Abstract not found", "Error", "Could not process the paper."
+def is_duplicate(filename, text, duplicate_index):
+    """ Check if extracted text is a near-duplicate of an earlier paper using MinHash/LSH.
+    Returns (matched filename, similarity) or None, indexing the paper when it is new. """
+    return duplicate_index.match_or_add(filename, text)
 
 # Streamlit UI
 st.title("📄 Research Paper Evaluator")
 st.sidebar.header("Upload PDF Files")
 uploaded_files = st.sidebar.file_uploader("Upload multiple research papers", type=["pdf"], accept_multiple_files=True)
+duplicate_threshold = st.sidebar.slider("Duplicate similarity threshold", min_value=0.5, max_value=1.0,
+                                        value=DEFAULT_THRESHOLD, step=0.05)
+st.sidebar.header("Screening Limits")
+concurrency = st.sidebar.number_input("Concurrent requests", min_value=1, value=DEFAULT_CONCURRENCY)
+requests_per_minute = st.sidebar.number_input("Requests per minute", min_value=1, value=DEFAULT_RPM)
+tokens_per_minute = st.sidebar.number_input("Tokens per minute", min_value=1000, value=DEFAULT_TPM)
+bypass_cache = st.sidebar.checkbox("Bypass LLM response cache (always re-query the model)")
+st.sidebar.header("Screening Mode")
+mode = st.sidebar.radio("How papers are sent to the model", ["Title/abstract first, full text only when needed",
+                                                               "Full text of every paper",
+                                                               "Titles/abstracts in batches (one request per batch)"])
+cascade = None
+batch_papers = None
+if mode.startswith("Titles/abstracts in batches"):
+    batch_papers = st.sidebar.number_input("Papers per request", min_value=1, value=DEFAULT_BATCH_PAPERS)
+    batch_tokens = st.sidebar.number_input("Tokens per request", min_value=1000, value=DEFAULT_BATCH_TOKENS, step=500)
+elif mode.startswith("Title/abstract first"):
+    exclude_confidence = st.sidebar.slider("Accept title/abstract exclusions from confidence", 0.5, 1.0,
+                                           DEFAULT_EXCLUDE_CONFIDENCE, 0.05)
+    accept_includes = st.sidebar.checkbox("Also accept confident title/abstract inclusions",
+                                          value=DEFAULT_INCLUDE_CONFIDENCE is not None)
+    include_confidence = st.sidebar.slider("Accept title/abstract inclusions from confidence", 0.5, 1.0,
+                                           DEFAULT_INCLUDE_CONFIDENCE or 0.95, 0.05, disabled=not accept_includes)
+    cascade = {"triage_model": TRIAGE_MODEL, "exclude_confidence": exclude_confidence,
+               "include_confidence": include_confidence if accept_includes else None}
 criteria = st.text_area("📝 Enter Inclusion Criteria", "The study must involve human subjects and analyze the impact of physical activity on cardiovascular health.")
 
 if st.button("Process Papers"):
@@ -114,20 +97,60 @@ if st.button("Process Papers"):
         st.warning("⚠️ Please upload at least one PDF file.")
     else:
         results = []
-        seen_texts = set()  # Track unique PDF contents
+        papers = []
+        duplicate_index = NearDuplicateIndex(threshold=duplicate_threshold)  # Track unique PDF contents
 
         for pdf_file in uploaded_files:
             text = extract_text_from_pdf(pdf_file)
 
-            if is_duplicate(text, seen_texts):
-                st.warning(f"⚠️ Duplicate detected: {pdf_file.name} was skipped.")
-                logger.info(f"Duplicate detected and skipped: {pdf_file.name}")
+            duplicate = is_duplicate(pdf_file.name, text, duplicate_index)
+            if duplicate:
+                matched_name, similarity = duplicate
+                st.warning(f"⚠️ Duplicate detected: {pdf_file.name} was skipped ({similarity:.0%} similar to {matched_name}).")
+                logger.info(f"Duplicate detected and skipped: {pdf_file.name} (matches {matched_name}, similarity {similarity:.2f})")
                 continue  # Skip duplicate PDFs
 
-            title, abstract, decision, reason = process_paper_with_openai(text, criteria)
-            results.append({"Filename": pdf_file.name, "Title": title, "Decision": decision, "Reason": reason})
+            papers.append((pdf_file.name, text))
+
+        # Screen concurrently under the shared rate limits; rows appear as each paper finishes
+        st.write("### 📊 Results:")
+        progress = st.progress(0.0)
+        table = st.empty()
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        if batch_papers:
+            outcomes = screen_papers_batched(papers, criteria, concurrency=concurrency, limiter=limiter,
+                                             bypass_cache=bypass_cache, budget_tokens=int(batch_tokens),
+                                             max_papers=int(batch_papers))
+        else:
+            outcomes = screen_papers(papers, criteria, concurrency=concurrency, limiter=limiter,
+                                     bypass_cache=bypass_cache, cascade=cascade)
+        for done, (filename, result, error) in enumerate(outcomes, start=1):
+            if error is not None:
+                logger.error(f"Error processing {filename} with OpenAI: {error}")
+                st.error(f"❌ Error processing {filename} with OpenAI: {error}")
+                title, abstract, decision, reason = "Title not found", "Abstract not found", "Error", "Could not process the paper."
+                stage = ""
+            else:
+                title, abstract, decision, reason = result[:4]
+                if batch_papers:
+                    stage = "Title/abstract (batched)"
+                else:
+                    stage = "Title/abstract" if cascade is not None and result[4] == "title_abstract" else "Full text"
+                logger.info(f"OpenAI processed paper: {title} ({stage})")
+            results.append({"Filename": filename, "Title": title, "Decision": decision, "Stage": stage,
+                            "Reason": reason})
+            progress.progress(done / len(papers))
+            table.dataframe(results)
         
+        cache_stats = get_default_cache().stats()
+        logger.info(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        if cascade is not None:
+            full_text = sum(row["Stage"] == "Full text" for row in results)
+            st.write(f"Full text was sent for {full_text} of {len(results)} papers.")
+        llm_stats = get_llm_cache().stats()
+        st.write(f"LLM response cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses "
+                 f"({llm_stats['hit_rate']:.0%} hit rate)")
         logger.info("Processing complete!")
         st.success("✅ Processing Complete!")
-        st.write("### 📊 Results:")
-        st.dataframe(results)
+
+show_metrics_panel()
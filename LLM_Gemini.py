@@ -1,9 +1,23 @@
 import os
+import time
 import streamlit as st
-import chromadb
-import PyPDF2
 from litellm import completion
 from dotenv import load_dotenv
+from bibliographic import paper_records
+from chunking import delete_papers
+from bm25_index import index_for
+from hybrid_search import hybrid_query_papers, DEFAULT_BM25_WEIGHT
+from context_packer import pack_context, DEFAULT_CONTEXT_TOKENS
+from collection_ops import remove_papers, find_duplicate_papers, find_excluded_papers, cluster_rows
+from near_duplicates import DEFAULT_THRESHOLD
+from keyword_matcher import parse_criteria, criterion_totals, matched_ids, hit_matrix_frame
+from embedding_service import get_embedding_service
+from extraction_cache import cached_extract, get_default_cache
+from llm_cache import get_llm_cache
+from metrics import get_metrics, usage_tokens
+from llm_streaming import stream_litellm, render_stream, format_timings
+from app_state import (get_chroma_client, cached_paper_ids, invalidate_paper_ids, upload_key, ingested_uploads,
+                       metadata_filter_inputs, show_metrics_panel)
 
 # Set environment variables. Uncomment this if you want to set them directly.
 os.environ["HUGGINGFACE_TOKEN"] = '********'
@@ -14,22 +28,19 @@ os.environ['LITELLM_LOG'] = 'DEBUG'
 HUGGINGFACE_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Initialize ChromaDB
-client = chromadb.PersistentClient(path="./chroma_db")
+# Initialize ChromaDB (one client for the server process; this script re-runs on every interaction)
+client = get_chroma_client("./chroma_db")
 collection_name = "pdf_collection"
 collection = client.get_or_create_collection(collection_name)
+embedder = get_embedding_service()  # Same model for documents and queries
 
 def extract_text_from_pdf(pdf_file):
     text = ""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        for page in pdf_reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + "\n"
+        text = cached_extract(pdf_file, "pypdf2")
     except Exception as e:
         st.error(f"Error processing {pdf_file.name}: {e}")
-    return text.strip() if text else ""
+    return text
 
 st.title("Systematic Review using Gemini")
 
@@ -38,59 +49,83 @@ st.header("1. Upload PDFs & Extract Text")
 uploaded_files = st.file_uploader("Upload PDF files", accept_multiple_files=True, type=["pdf"])
 
 if uploaded_files:
-    for pdf in uploaded_files:
+    # Each upload is ingested once per session; later reruns skip straight past it
+    ingested = ingested_uploads()
+    new_files = [(pdf, upload_key(pdf)) for pdf in uploaded_files]
+    new_files = [(pdf, key) for pdf, key in new_files if key not in ingested]
+    for pdf, key in new_files:
         extracted_text = extract_text_from_pdf(pdf)
         if extracted_text:
-            collection.add(documents=[extracted_text], metadatas=[{"filename": pdf.name}], ids=[pdf.name])
+            chunk_ids, chunk_docs, chunk_metas = paper_records(pdf.name, extracted_text, {"filename": pdf.name})
+            delete_papers(collection, [pdf.name])  # A changed re-upload may have fewer chunks than the old copy
+            collection.upsert(documents=chunk_docs, metadatas=chunk_metas, ids=chunk_ids,
+                              embeddings=embedder.embed_documents(chunk_docs))
+            index_for(collection).add(chunk_ids, chunk_docs, chunk_metas)
             st.success(f"Added: {pdf.name}")
         else:
             st.warning(f"Skipping empty PDF: {pdf.name}")
-    st.write(f"Total documents in ChromaDB: {collection.count()}")
+        ingested[key] = pdf.name
+    if new_files:
+        invalidate_paper_ids(collection)
+        cache_stats = get_default_cache().stats()
+        st.write(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    st.write(f"Total documents in ChromaDB: {len(cached_paper_ids(collection))}")
 
 # Stage 2: Remove Duplicates
 st.header("2. Remove Duplicates")
+dry_run = st.checkbox("Preview only (dry run): list the documents that would be removed")
+threshold = st.slider("Duplicate similarity threshold (1.0 = identical text only)",
+                      min_value=0.5, max_value=1.0, value=DEFAULT_THRESHOLD, step=0.05)
 if st.button("Deduplicate Documents"):
-    results = collection.get()
-    seen_documents = set()
-    unique_documents, unique_metadatas, unique_ids = [], [], []
-    for doc, metadata, doc_id in zip(results['documents'], results['metadatas'], results['ids']):
-        if doc not in seen_documents:
-            unique_documents.append(doc)
-            unique_metadatas.append(metadata)
-            unique_ids.append(doc_id)
-            seen_documents.add(doc)
-    client.delete_collection(collection_name)
-    collection = client.create_collection(collection_name)
-    collection.add(documents=unique_documents, metadatas=unique_metadatas, ids=unique_ids)
-    st.success(f"Duplicates removed. Remaining documents: {collection.count()}")
+    duplicate_ids, clusters = find_duplicate_papers(collection, threshold)
+    remove_papers(collection, duplicate_ids, dry_run=dry_run)
+    invalidate_paper_ids(collection)
+    if clusters:
+        st.dataframe(cluster_rows(clusters))
+    if dry_run:
+        st.info(f"{len(duplicate_ids)} duplicates would be removed: {', '.join(duplicate_ids) or 'None'}")
+    else:
+        st.success(f"Duplicates removed. Remaining documents: {len(cached_paper_ids(collection))}")
 
 # Stage 3: Exclusion Criteria
 st.header("3. Exclude Documents by Keywords")
 exclusion_keywords = st.text_input("Enter exclusion keywords separated by commas (case-insensitive)")
+word_boundaries = st.checkbox("Match whole words only", value=True)
+stemming = st.checkbox("Also match word variants (e.g. 'therapies' for 'therapy')", value=True)
 
 if st.button("Apply Exclusion") and exclusion_keywords:
-    exclusion_keywords = [keyword.strip().lower() for keyword in exclusion_keywords.split(',')]
-    results = collection.get()
-    filtered_documents, filtered_metadatas, filtered_ids = [], [], []
-    for doc, metadata, doc_id in zip(results['documents'], results['metadatas'], results['ids']):
-        if not any(keyword in doc.lower() for keyword in exclusion_keywords):
-            filtered_documents.append(doc)
-            filtered_metadatas.append(metadata)
-            filtered_ids.append(doc_id)
-    client.delete_collection(collection_name)
-    collection = client.create_collection(collection_name)
-    collection.add(documents=filtered_documents, metadatas=filtered_metadatas, ids=filtered_ids)
-    st.success(f"Documents after exclusion: {collection.count()}")
+    exclusion_keywords = parse_criteria(exclusion_keywords)
+    excluded_ids, hit_matrix = find_excluded_papers(
+        collection, exclusion_keywords, word_boundaries=word_boundaries, stemming=stemming
+    )
+    remove_papers(collection, excluded_ids, dry_run=dry_run)
+    invalidate_paper_ids(collection)
+    st.write("Documents matched per keyword:", criterion_totals(hit_matrix, exclusion_keywords))
+    if matched_ids(hit_matrix):
+        st.dataframe(hit_matrix_frame(hit_matrix, exclusion_keywords))
+    if dry_run:
+        st.info(f"{len(excluded_ids)} documents would be excluded: {', '.join(excluded_ids) or 'None'}")
+    else:
+        st.success(f"Documents after exclusion: {len(hit_matrix) - len(excluded_ids)}")
 
 # Stage 4: Query Documents using Gemini
 st.header("4. Ask a Question")
 question = st.text_input("Enter your question")
+bypass_cache = st.checkbox("Bypass LLM response cache (always re-query the model)")
+context_tokens = st.number_input("Context token budget", min_value=500, value=DEFAULT_CONTEXT_TOKENS, step=500)
+stream = st.checkbox("Stream the response as it is generated", value=True)
+bm25_weight = st.slider("Keyword match weight (0 = meaning only)", 0.0, 3.0, DEFAULT_BM25_WEIGHT, 0.25)
+where = metadata_filter_inputs()
 if st.button("Search in Documents") and question:
     try:
-        results = collection.query(query_texts=[question])
-        relevant_docs = results['documents'][0]
-        ids = results['ids'][0]
-        context = "\n\n".join(relevant_docs)
+        # Retrieve the best chunks (semantic and keyword) and group them into the 10 most relevant papers
+        papers = hybrid_query_papers(collection, question, embedder.embed_query(question), top_k=10,
+                                     bm25_weight=bm25_weight, where=where)
+        # Fill the token budget with the best passages; ids lists only the documents that made it in
+        packed = pack_context(papers, budget_tokens=int(context_tokens), model="gemini/gemini-1.5-flash")
+        ids = packed["paper_ids"]
+        context = packed["context"]
+        st.caption(f"Context: {packed['tokens']} tokens from {len(ids)} documents")
         prompt = f"""
         You are an AI assistant performing a systematic literature review.
         ###
@@ -112,12 +147,36 @@ if st.button("Search in Documents") and question:
 
         Output the answer in a structured table format:
         """
-        response = completion(
-            model="gemini/gemini-1.5-flash",
-            messages=[{"role": "user", "content": prompt}],
-            api_key=GEMINI_API_KEY
-        )
-        answer = response['choices'][0]['message']['content'].strip()
-        st.write(answer)
+        messages = [{"role": "user", "content": prompt}]
+        placeholder = st.empty()
+        timings = {}
+
+        def call():
+            if stream:
+                text, stream_timings = render_stream(
+                    stream_litellm("gemini/gemini-1.5-flash", messages, api_key=GEMINI_API_KEY), placeholder,
+                    model="gemini/gemini-1.5-flash", messages=messages
+                )
+                timings.update(stream_timings)
+                return text
+            start = time.perf_counter()
+            response = completion(
+                model="gemini/gemini-1.5-flash",
+                messages=messages,
+                api_key=GEMINI_API_KEY
+            )
+            get_metrics().record_llm_call("gemini/gemini-1.5-flash", time.perf_counter() - start,
+                                          *usage_tokens(response))
+            return response['choices'][0]['message']['content'].strip()
+
+        answer = get_llm_cache().cached("gemini/gemini-1.5-flash", messages, call, bypass=bypass_cache)
+        if timings:
+            st.caption(format_timings(timings))
+        else:
+            placeholder.write(answer)  # Not streamed, or served from the cache
+        llm_stats = get_llm_cache().stats()
+        st.write(f"LLM response cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses")
     except Exception as e:
         st.error(f"Error: {e}")
+
+show_metrics_panel()
@@ -1,92 +1,88 @@
 import os
-import PyPDF2
+import time
 import streamlit as st
-from sentence_transformers import SentenceTransformer
-import chromadb
-import ollama  # ✅ Replaced OpenAI with Ollama
+from pdf_ingestion import DEFAULT_WORKERS
+from ingest_manifest import sync_folder
+from bm25_index import index_for
+from hybrid_search import hybrid_query_papers, DEFAULT_BM25_WEIGHT
+from context_packer import pack_context, DEFAULT_CONTEXT_TOKENS
+from collection_ops import remove_papers, find_excluded_papers, count_papers
+from keyword_matcher import parse_criteria, criterion_totals, matched_ids, hit_matrix_frame
+from embedding_service import get_embedding_service
+from llm_cache import get_llm_cache
+from metrics import get_metrics, usage_tokens
+from llm_streaming import stream_ollama, render_stream, format_timings
+from ollama_manager import get_model_manager
+from app_state import get_chroma_client, metadata_filter_inputs, show_metrics_panel
 
-# Initialize ChromaDB client
-client_chroma = chromadb.PersistentClient(path="chroma_db")
-text_embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+# Shared handles: created on the first run and reused by every rerun of this script
+client_chroma = get_chroma_client("chroma_db")
+MANIFEST_PATH = os.path.join("chroma_db", "knowledge_base_manifest.json")
+embedder = get_embedding_service()  # Same model for documents and queries
+model_manager = get_model_manager()  # One persistent Ollama client; the model is pulled and loaded once
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    try:
-        with open(pdf_path, "rb") as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-    except Exception as e:
-        st.write(f"Error processing {pdf_path}: {e}")
-    return text
+def process_text_and_store(folder_path, workers=DEFAULT_WORKERS, full_rebuild=False):
+    if full_rebuild:
+        try:
+            client_chroma.delete_collection(name="knowledge_base")
+            index_for("knowledge_base", "chroma_db").clear()
+        except Exception:
+            pass
 
-def process_text_and_store(folder_path):
-    try:
-        client_chroma.delete_collection(name="knowledge_base")
-    except Exception:
-        pass
-
-    collection = client_chroma.create_collection(name="knowledge_base")
-    seen_texts = set()
-    processed_count = 0
-    total_files = 0
-    
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".pdf"):
-            total_files += 1
-            file_path = os.path.join(folder_path, filename)
-            extracted_text = extract_text_from_pdf(file_path)
-            if extracted_text and extracted_text not in seen_texts:
-                seen_texts.add(extracted_text)
-                collection.add(
-                    documents=[extracted_text],
-                    metadatas=[{"source": filename}],
-                    ids=[filename]
-                )
-                processed_count += 1
-    
-    st.write(f"Total PDFs processed: {total_files}")
-    st.write(f"Total unique articles stored: {processed_count}")
+    # Incremental sync: only new or changed PDFs are extracted and embedded
+    collection = client_chroma.get_or_create_collection(name="knowledge_base")
+    report = sync_folder(folder_path, collection, MANIFEST_PATH, metadata_key="source",
+                         workers=workers, skip_duplicates=True,
+                         embed_fn=embedder.embed_documents)
+    for filename, error in report["errors"].items():
+        st.write(f"Error processing {filename}: {error}")
+
+    st.write(f"New: {len(report['new'])}, updated: {len(report['updated'])}, "
+             f"removed: {len(report['removed'])}, unchanged: {len(report['unchanged'])}")
+    for label in ("new", "updated", "removed", "restored"):
+        if report[label]:
+            st.write(f"{label.capitalize()} articles: {', '.join(report[label])}")
+    st.write(f"Total unique articles stored: {count_papers(collection)}")
+    st.write(f"Extraction cache: {report['cache']['hits']} hits, {report['cache']['misses']} misses")
     return collection
 
 # Function for exclusion criteria
 
 def filter_articles(collection, exclusion_criteria):
-    articles = collection.get()
-    filtered_ids = []
-    initial_count = len(articles['documents'])
-    
-    for doc, meta in zip(articles['documents'], articles['metadatas']):
-        if any(criterion.lower() in doc.lower() for criterion in exclusion_criteria):
-            filtered_ids.append(meta['source'])
+    # One streaming pass over the chunks, matching all criteria at once
+    _, hit_matrix = find_excluded_papers(collection, exclusion_criteria)
+    filtered_ids = matched_ids(hit_matrix)
+    initial_count = len(hit_matrix)
     
-    if filtered_ids:
-        collection.delete(ids=filtered_ids)
+    remove_papers(collection, filtered_ids)
     
-    remaining_count = collection.count()
+    remaining_count = initial_count - len(filtered_ids)
     st.write(f"Total unique articles after exclusion: {remaining_count}")
     st.write(f"Excluded articles: {', '.join(filtered_ids) if filtered_ids else 'None'}")
+    st.write("Articles matched per criterion:", criterion_totals(hit_matrix, exclusion_criteria))
+    if filtered_ids:
+        st.dataframe(hit_matrix_frame(hit_matrix, exclusion_criteria))
     return collection
 
 # The query for the resarch questions
 
-def semantic_search(query, collection, top_k=7):
-    query_embedding = text_embedding_model.encode(query)
-    results = collection.query(
-        query_embeddings=[query_embedding.tolist()], n_results=top_k
-    )
-    return results
+def semantic_search(query, collection, top_k=7, bm25_weight=DEFAULT_BM25_WEIGHT, where=None):
+    query_embedding = embedder.embed_query(query)
+    # Semantic and keyword chunk hits are fused, then aggregated back to the top_k papers
+    return hybrid_query_papers(collection, query, query_embedding, top_k=top_k, bm25_weight=bm25_weight,
+                               where=where)
 
-def generate_response(query, results):
-    if not results["documents"]:
+def generate_response(query, results, bypass_cache=None, context_tokens=DEFAULT_CONTEXT_TOKENS, placeholder=None):
+    """ With a placeholder (st.empty()) the answer is streamed into it, sources appended at the end. """
+    if not results:
         return "No relevant documents found."
     
-    sources = [meta["source"] for meta in results["metadatas"][0]]
-    context = "\n".join(results["documents"][0])
+    # Sources are the documents whose passages fit the token budget, not every hit
+    packed = pack_context(results, budget_tokens=context_tokens, model=model_manager.model)
+    sources = packed["paper_ids"]
+    context = packed["context"]
     prompt = f"Query: {query}\nContext: {context}\nAnswer:"
-    os.system("ollama pull llama3")
-    
-    response = ollama.chat(model="llama3", messages = [
+    messages = [
                 {
                     "role": "system",
                     "content": f"""
@@ -100,7 +96,7 @@ def generate_response(query, results):
                     - The reason should be a concise explanation of why the document is relevant
                     - The table should have three columns: "File Name/ID", "Document Section", and "Reason for Relevance".
                     - The "File Name/ID" column should contain the filename or ID of the document from ids.
-                    - The "Document Section" should be the relevant section.
+                    - The "Document Section" should be the relevant section (each passage is prefixed with its section label).
                     - The reason should be a concise explanation of why the document is relevant
                     ###
                     Context:
@@ -108,24 +104,55 @@ def generate_response(query, results):
                     """
                 },
                 {"role": "user", "content": query},
-            ])
+            ]
 
-    response_text = response['message']['content']
     source_list = "\n".join(f"- {source}" for source in sources)
-    
-    return f"{response_text}\n\nSources:\n{source_list}"
+    timings = {}
+
+    def call():
+        if placeholder is not None:
+            text, stream_timings = render_stream(stream_ollama(model_manager, messages), placeholder,
+                                                 suffix=f"\n\nSources:\n{source_list}",
+                                                 model=model_manager.model, messages=messages)
+            timings.update(stream_timings)
+            return text
+        start = time.perf_counter()
+        response = model_manager.chat(messages)
+        get_metrics().record_llm_call(model_manager.model, time.perf_counter() - start, *usage_tokens(response))
+        return response['message']['content']
+
+    response_text = get_llm_cache().cached(model_manager.model, messages, call, bypass=bypass_cache)
+    answer = f"{response_text}\n\nSources:\n{source_list}"
+    if placeholder is not None:
+        if timings:
+            st.caption(format_timings(timings))
+        else:
+            placeholder.markdown(answer)  # Cache hit: nothing was streamed
+    return answer
 
 def main():
     st.title("Systematic Review (Ollama)")
+
+    # ready() only does work on the first run; later reruns get the stored status
+    try:
+        with st.spinner(f"Loading {model_manager.model}..."):
+            status = model_manager.ready()
+        st.caption(f"{status['model']} ready on {status['host']} (warm-up answered in {status['warmup_latency']:.2f}s)")
+    except Exception as e:
+        st.error(f"Ollama is not reachable at {model_manager.host}: {e}")
     
     if "collection" not in st.session_state:
         st.session_state["collection"] = None
 
     folder_path = st.text_input("Enter the folder path containing PDFs:")
+    workers = st.number_input("Extraction workers:", min_value=1, value=DEFAULT_WORKERS)
+    full_rebuild = st.checkbox("Rebuild the knowledge base from scratch")
     if st.button("Process Folder") and folder_path:
         if os.path.exists(folder_path) and os.path.isdir(folder_path):
             st.write("Processing documents in the folder...")
-            st.session_state["collection"] = process_text_and_store(folder_path)
+            st.session_state["collection"] = process_text_and_store(
+                folder_path, workers=int(workers), full_rebuild=full_rebuild
+            )
             st.success("PDF content processed and stored successfully!")
         else:
             st.error("Invalid folder path. Please enter a valid directory.")
@@ -133,22 +160,29 @@ def main():
     if st.session_state["collection"]:
         exclusion_criteria = st.text_area("Enter exclusion criteria (comma-separated):")
         if st.button("Apply Exclusion Criteria") and exclusion_criteria:
-            exclusion_list = [crit.strip() for crit in exclusion_criteria.split(",")]
+            exclusion_list = parse_criteria(exclusion_criteria)
             st.session_state["collection"] = filter_articles(st.session_state["collection"], exclusion_list)
             st.success("Exclusion criteria applied successfully!")
         
         query = st.text_input("Enter your query:")
+        bypass_cache = st.checkbox("Bypass LLM response cache (always re-query the model)")
+        context_tokens = st.number_input("Context token budget:", min_value=500, value=DEFAULT_CONTEXT_TOKENS, step=500)
+        stream = st.checkbox("Stream the response as it is generated", value=True)
+        bm25_weight = st.slider("Keyword match weight (0 = meaning only)", 0.0, 3.0, DEFAULT_BM25_WEIGHT, 0.25)
+        where = metadata_filter_inputs()
         if st.button("Execute Query") and query:
-            results = semantic_search(query, st.session_state["collection"])
-            response = generate_response(query, results)
+            results = semantic_search(query, st.session_state["collection"], bm25_weight=bm25_weight,
+                                      where=where)
             st.subheader("Generated Response:")
-            st.write(response)
+            placeholder = st.empty() if stream else None
+            response = generate_response(query, results, bypass_cache=bypass_cache,
+                                         context_tokens=int(context_tokens), placeholder=placeholder)
+            if placeholder is None:
+                st.write(response)
+            llm_stats = get_llm_cache().stats()
+            st.write(f"LLM response cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses")
 
-        while True:
-            another_question = input("Do you have another query? (yes/no): ")
-            if another_question.lower() != 'yes':
-                break
-        
+    show_metrics_panel()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,23 @@
 import os
+import time
 import streamlit as st
-import chromadb
-from chromadb.config import Settings
-import PyPDF2
 import pandas as pd
 import csv  # Import the csv module
 import openai
+from extraction_cache import get_default_cache
+from hybrid_search import hybrid_query_papers, DEFAULT_BM25_WEIGHT
+from context_packer import pack_context, DEFAULT_CONTEXT_TOKENS
+from collection_ops import (remove_papers, find_duplicate_papers, find_excluded_papers, cluster_rows,
+                            list_paper_ids, count_papers)
+from near_duplicates import DEFAULT_THRESHOLD
+from keyword_matcher import parse_criteria, criterion_totals, matched_ids, hit_matrix_frame
+from embedding_service import get_embedding_service
+from pdf_ingestion import ingest_pdfs, list_pdfs, DEFAULT_WORKERS
+from llm_cache import get_llm_cache
+from metrics import get_metrics, usage_tokens
+from llm_streaming import stream_openai, render_stream, format_timings
+from app_state import (get_chroma_client, cached_paper_ids, invalidate_paper_ids, metadata_filter_inputs,
+                       show_metrics_panel)
 
 try:
     from config import api_key
@@ -14,113 +26,61 @@ except ImportError:
     st.error("Error: config.py not found or api_key not defined.")
     exit(1)  # Exit the script if the API key is not found
 
-# Initialize ChromaDB with persistent storage
+# Initialize ChromaDB with persistent storage (the client is created once and reused across reruns)
 def initialize_chromadb():
-    client = chromadb.Client(Settings(persist_directory="./chroma_db", is_persistent=True))  # Make storage persistent
-    collection_name = "pdf_documents"
-    try:
-        collection = client.get_collection(name=collection_name)
-    except chromadb.errors.InvalidCollectionException:
-        collection = client.create_collection(name=collection_name)
+    client = get_chroma_client("./chroma_db")
+    collection = client.get_or_create_collection(name="pdf_documents")
     return client, collection
 
-# Extract text from PDF
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    try:
-        with open(pdf_path, "rb") as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-    except Exception as e:
-        st.error(f"Error processing {pdf_path}: {e}")
-    return text
-
 # Process PDFs in the selected directory
-def process_pdfs(data_dir, collection):
-    total_added = 0
-    for filename in os.listdir(data_dir):
-        if filename.endswith(".pdf"):
-            filepath = os.path.join(data_dir, filename)
-            extracted_text = extract_text_from_pdf(filepath)
-            if extracted_text:
-                collection.add(
-                    documents=[extracted_text],
-                    metadatas=[{"filename": filename}],
-                    ids=[filename]
-                )
-                print(f"PDF '{filename}' has been added to ChromaDB.")
-                total_added += 1
-    return total_added
-
-# Remove duplicate documents
-def remove_duplicates(client, collection_name):
+def process_pdfs(data_dir, collection, workers=DEFAULT_WORKERS):
+    report = ingest_pdfs(list_pdfs(data_dir), collection, metadata_key="filename", workers=workers,
+                         embed_fn=get_embedding_service().embed_documents)
+    for filename, error in report["errors"].items():
+        st.error(f"Error processing {filename}: {error}")
+    return len(report["added"])
+
+# Remove duplicate documents (compared per paper, across all of its chunks)
+def remove_duplicates(client, collection_name, dry_run=False, threshold=DEFAULT_THRESHOLD):
     collection = client.get_collection(name=collection_name)
-    results = collection.get()
-    
-    documents = results['documents']
-    metadatas = results['metadatas']
-    ids = results['ids']
 
-    unique_documents = []
-    unique_metadatas = []
-    unique_ids = []
-    
-    seen_documents = set()
-    for doc, metadata, doc_id in zip(documents, metadatas, ids):
-        if doc not in seen_documents:
-            unique_documents.append(doc)
-            unique_metadatas.append(metadata)
-            unique_ids.append(doc_id)
-            seen_documents.add(doc)
-
-    # Delete the existing collection
-    client.delete_collection(name=collection_name)
+    # Only the duplicates are deleted; the remaining embeddings are left untouched
+    duplicate_ids, clusters = find_duplicate_papers(collection, threshold)
+    remove_papers(collection, duplicate_ids, dry_run=dry_run)
 
-    # Create a new collection with unique documents
-    collection = client.create_collection(name=collection_name)
-    collection.add(documents=unique_documents, metadatas=unique_metadatas, ids=unique_ids)
-
-    return len(unique_documents)
+    if clusters:
+        st.dataframe(pd.DataFrame(cluster_rows(clusters)))
+    return count_papers(collection) - (len(duplicate_ids) if dry_run else 0), duplicate_ids
 
 # Exclude documents based on multiple criteria
-def exclude_documents(client, collection_name, exclusion_criteria_list):
+def exclude_documents(client, collection_name, exclusion_criteria_list, dry_run=False,
+                      word_boundaries=True, stemming=True):
     collection = client.get_collection(name=collection_name)
-    results = collection.get()
-    
-    documents = results['documents']
-    metadatas = results['metadatas']
-    ids = results['ids']
-
-    filtered_documents = []
-    filtered_metadatas = []
-    filtered_ids = []
-
-    exclusion_criteria_list = [criteria.strip().lower() for criteria in exclusion_criteria_list.split(',')]
-
-    for doc, metadata, doc_id in zip(documents, metadatas, ids):
-        # Check if doc is not None before applying the filter
-        if doc and not any(criteria in doc.lower() for criteria in exclusion_criteria_list):  # Case-insensitive filtering
-            filtered_documents.append(doc)
-            filtered_metadatas.append(metadata)
-            filtered_ids.append(doc_id)
-
-    # Delete the existing collection
-    client.delete_collection(name=collection_name)
-    collection = client.create_collection(name=collection_name)
-
-    # Prevent adding empty lists
-    if filtered_documents:
-        collection.add(documents=filtered_documents, metadatas=filtered_metadatas, ids=filtered_ids)
-        return len(filtered_documents)
-    else:
+
+    exclusion_criteria_list = parse_criteria(exclusion_criteria_list)
+
+    # Case-insensitive single-pass matching; empty documents are excluded as well
+    excluded_ids, hit_matrix = find_excluded_papers(
+        collection, exclusion_criteria_list, word_boundaries=word_boundaries, stemming=stemming
+    )
+    remove_papers(collection, excluded_ids, dry_run=dry_run)
+
+    remaining = len(hit_matrix) - len(excluded_ids)
+    if not remaining:
         st.warning("All documents were filtered out based on the exclusion criteria. No documents remain in the collection.")
-        return 0
+    show_hit_matrix(hit_matrix, exclusion_criteria_list)
+    return remaining, excluded_ids
+
+# Show which exclusion criteria matched which documents
+def show_hit_matrix(hit_matrix, criteria):
+    totals = criterion_totals(hit_matrix, criteria)
+    st.write("Documents matched per criterion:", totals)
+    if matched_ids(hit_matrix):
+        st.dataframe(hit_matrix_frame(hit_matrix, criteria), height=300)
     
 # Export ids to CSV
 def export_ids_to_csv(collection):
-    results = collection.get()
-    ids = results['ids']
+    ids = sorted(list_paper_ids(collection))
 
     # Specify the CSV file path
     csv_file_path = 'ids.csv'
@@ -137,15 +97,25 @@ def export_ids_to_csv(collection):
         st.error(f"An error occurred: {e}")
 
 # Ask a question to the OpenAI API and retrieve relevant documents
-def ask_question(collection, question):
+def ask_question(collection, question, bypass_cache=None, context_tokens=DEFAULT_CONTEXT_TOKENS, placeholder=None,
+                 bm25_weight=DEFAULT_BM25_WEIGHT, where=None):
+    """
+    With a placeholder (st.empty()) the answer is streamed into it token by token.
+    bm25_weight sets how much exact keyword matches count against semantic similarity;
+    where limits retrieval to papers with matching metadata (database, year).
+    """
     try:
-        results = collection.query(query_texts=[question], n_results=10)
+        query_embedding = get_embedding_service().embed_query(question)
 
-        # Fetch documents, metadata, and IDs
-        relevant_documents = results['documents'][0]
-        ids = results['ids'][0]
+        # Retrieve the best chunks (semantic and keyword) and group them into the 10 most relevant papers
+        papers = hybrid_query_papers(collection, question, query_embedding, top_k=10, bm25_weight=bm25_weight,
+                                     where=where)
 
-        context = "\n\n".join(relevant_documents)
+        # Only the best passages that fit the token budget go into the prompt
+        packed = pack_context(papers, budget_tokens=context_tokens, model="gpt-4o-mini")
+        context = packed["context"]
+        st.caption(f"Context: {packed['tokens']} tokens from {len(packed['paper_ids'])} documents "
+                   f"({', '.join(packed['paper_ids'])})")
 
         messages = [
             {
@@ -170,16 +140,34 @@ def ask_question(collection, question):
             {"role": "user", "content": question},
         ]
 
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=1500,
-            temperature=0.5,
-            n=1,
-            stop=None,
-        )
-
-        answer = response.choices[0].message['content'].strip()
+        params = {"max_tokens": 1500, "temperature": 0.5}
+
+        timings = {}
+
+        def call():
+            if placeholder is not None:
+                text, stream_timings = render_stream(stream_openai("gpt-4o-mini", messages, **params), placeholder,
+                                                     model="gpt-4o-mini", messages=messages)
+                timings.update(stream_timings)
+                return text
+            start = time.perf_counter()
+            response = openai.ChatCompletion.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                n=1,
+                stop=None,
+                **params,
+            )
+            get_metrics().record_llm_call("gpt-4o-mini", time.perf_counter() - start, *usage_tokens(response))
+            return response.choices[0].message['content'].strip()
+
+        # Identical question, context and settings are answered from the on-disk cache
+        answer = get_llm_cache().cached("gpt-4o-mini", messages, call, params=params, bypass=bypass_cache)
+        if placeholder is not None:
+            if timings:
+                st.caption(format_timings(timings))
+            else:
+                placeholder.markdown(answer)  # Cache hit: nothing was streamed
 
         # Return the answer with the relevant document info and file names
         return answer
@@ -195,22 +183,25 @@ def main():
 
     # User inputs the directory path
     data_dir = st.text_input("Enter the directory path:", "")
+    workers = st.number_input("Extraction workers:", min_value=1, value=DEFAULT_WORKERS)
 
     if st.button("Process PDFs"):
         if not os.path.isdir(data_dir):
             st.error("Invalid directory. Please enter a valid directory path.")
         else:
             client, collection = initialize_chromadb()
-            total_added = process_pdfs(data_dir, collection)
+            total_added = process_pdfs(data_dir, collection, workers=int(workers))
+            invalidate_paper_ids(collection)
             st.success(f"Successfully added {total_added} documents to the collection.")
-            st.write(f"Total documents in collection: {collection.count()}")
+            st.write(f"Total documents in collection: {count_papers(collection)}")
+            cache_stats = get_default_cache().stats()
+            st.write(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
     # Initialize ChromaDB client
     client, collection = initialize_chromadb()
 
-    # Fetch all document IDs from ChromaDB
-    results = collection.get()
-    ids = results['ids']
+    # Document IDs are scanned once per session and rescanned only after the collection changes
+    ids = cached_paper_ids(collection)
 
     # Display stored document IDs in a scrollable table
     st.subheader("Stored Documents in ChromaDB")
@@ -220,34 +211,63 @@ def main():
     else:
         st.write("No documents found in the database.")
 
+    dry_run = st.checkbox("Preview only (dry run): list the documents that would be removed")
+
     # Remove Duplicates Button
+    threshold = st.slider("Duplicate similarity threshold (1.0 = identical text only)",
+                          min_value=0.5, max_value=1.0, value=DEFAULT_THRESHOLD, step=0.05)
     if st.button("Remove Duplicates"):
-        unique_count = remove_duplicates(client, "pdf_documents")
-        st.success(f"Successfully removed duplicates. Number of unique documents: {unique_count}")
+        unique_count, duplicate_ids = remove_duplicates(client, "pdf_documents", dry_run=dry_run, threshold=threshold)
+        invalidate_paper_ids(collection)
+        if dry_run:
+            st.info(f"{len(duplicate_ids)} duplicates would be removed: {', '.join(duplicate_ids) or 'None'}")
+        else:
+            st.success(f"Successfully removed duplicates. Number of unique documents: {unique_count}")
 
     # Exclusion Criteria Section (First)
     st.subheader("Exclusion Criteria")
     exclusion_criteria = st.text_input("Enter exclusion keywords or phrases (comma-separated):")
+    word_boundaries = st.checkbox("Match whole words only", value=True)
+    stemming = st.checkbox("Also match word variants (e.g. 'therapies' for 'therapy')", value=True)
 
     if st.button("Apply Exclusion Criteria"):
         if exclusion_criteria.strip():
-            remaining_count = exclude_documents(client, "pdf_documents", exclusion_criteria)
-            st.success(f"Successfully filtered documents. Remaining documents: {remaining_count}")
+            remaining_count, excluded_ids = exclude_documents(
+                client, "pdf_documents", exclusion_criteria, dry_run=dry_run,
+                word_boundaries=word_boundaries, stemming=stemming
+            )
+            invalidate_paper_ids(collection)
+            if dry_run:
+                st.info(f"{len(excluded_ids)} documents would be excluded: {', '.join(excluded_ids) or 'None'}")
+            else:
+                st.success(f"Successfully filtered documents. Remaining documents: {remaining_count}")
         else:
             st.error("Please enter valid exclusion keywords or phrases.")
 
     # Inclusion Criteria Section (Second)
     st.subheader("Inclusion Criteria")
     question = st.text_input("Enter your question to filter documents:")
+    bypass_cache = st.checkbox("Bypass LLM response cache (always re-query the model)")
+    context_tokens = st.number_input("Context token budget:", min_value=500, value=DEFAULT_CONTEXT_TOKENS, step=500)
+    stream = st.checkbox("Stream the response as it is generated", value=True)
+    bm25_weight = st.slider("Keyword match weight (0 = meaning only)", 0.0, 3.0, DEFAULT_BM25_WEIGHT, 0.25)
+    where = metadata_filter_inputs()
 
     if st.button("Apply Inclusion Criteria"):
         if question:
-            answer = ask_question(collection, question)
-            if answer:
-                st.subheader("Relevant Documents")
+            st.subheader("Relevant Documents")
+            placeholder = st.empty() if stream else None
+            answer = ask_question(collection, question, bypass_cache=bypass_cache,
+                                  context_tokens=int(context_tokens), placeholder=placeholder,
+                                  bm25_weight=bm25_weight, where=where)
+            if answer and placeholder is None:
                 st.markdown(answer)
+            llm_stats = get_llm_cache().stats()
+            st.write(f"LLM response cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses")
         else:
             st.error("Please enter a question for inclusion criteria.")
 
+    show_metrics_panel()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
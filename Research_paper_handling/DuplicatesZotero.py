@@ -1,50 +1,196 @@
-import pandas as pd
 import os
+import re
+import sys
+import csv
+import time
+import hashlib
+import argparse
+import unicodedata
+
+import pandas as pd
+
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from near_duplicates import NearDuplicateIndex, DEFAULT_THRESHOLD
+
+# Folder containing the Zotero CSV exports; unique records are written to <folder>/Unique
+DEFAULT_FOLDER = "Zotero Files"
+CHUNK_ROWS = 5000  # Rows read at a time, so memory does not grow with the size of an export
+# Exported columns that are read and written back; the ones missing from an export are skipped
+COLUMNS = ["Author", "Title", "Publication Year", "DOI", "Abstract Note", "File Attachments"]
+MIN_TITLE_CHARS = 20  # Shorter folded titles ("Editorial", "Letter") are too generic to match on
+AUTHOR_YEAR_TITLE_WORDS = 4
+# Keys in the order they are checked; the first one found in the index decides the match
+KEY_KINDS = ["doi", "title", "author_year", "abstract"]
+NEAR_DUPLICATE = "near_duplicate_abstract"
+
+REPORT_COLUMNS = ["Duplicate Source", "Duplicate Row", "Duplicate Title", "Canonical Source", "Canonical Row",
+                  "Canonical Title", "Matched Key", "Similarity"]
+NEAR_REPORT_COLUMNS = ["Canonical Title", "Canonical Source", "Duplicate Title", "Duplicate Source", "Similarity"]
+
+_DOI_PREFIX_RE = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.IGNORECASE)
+
+
+def _text(value):
+    return "" if value is None or (isinstance(value, float) and value != value) else str(value).strip()
+
+
+# Lowercase, accents removed, everything but letters and digits collapsed to single spaces
+def fold(text):
+    text = unicodedata.normalize("NFKD", _text(text)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def normalize_doi(doi):
+    doi = _DOI_PREFIX_RE.sub("", _text(doi)).strip().rstrip(".").lower()
+    return doi if doi.startswith("10.") else ""
+
+
+# Surname of the first author ("Smith, Jane; Doe, John" -> "smith")
+def first_author(authors):
+    first = _text(authors).split(";")[0]
+    return fold(first.split(",")[0] if "," in first else first.split(" ")[-1])
+
+
+def record_keys(row):
+    """
+    Normalized match keys for one record, as (kind, value) in KEY_KINDS order. The author+year
+    key also carries the first title words so two papers by one author in one year stay apart.
+    """
+    keys = []
+    doi = normalize_doi(row.get("DOI"))
+    if doi:
+        keys.append(("doi", doi))
+    title = fold(row.get("Title"))
+    if len(title) >= MIN_TITLE_CHARS:
+        keys.append(("title", title))
+    author, year = first_author(row.get("Author")), _text(row.get("Publication Year"))[:4]
+    if author and year and title:
+        keys.append(("author_year", f"{author}|{year}|{' '.join(title.split()[:AUTHOR_YEAR_TITLE_WORDS])}"))
+    abstract = fold(row.get("Abstract Note"))
+    if abstract:
+        keys.append(("abstract", abstract))
+    return keys
+
+
+# 8-byte digest of a key: the index holds these instead of the key strings
+def key_digest(kind, value):
+    return hashlib.blake2b(f"{kind}:{value}".encode("utf-8"), digest_size=8).digest()
+
+
+class DedupeIndex:
+    """
+    Compact index of every kept record's key digests (digest -> record number), plus an LSH
+    index over abstracts for near-duplicates. Records are checked and added in one pass, so
+    the first copy seen is always the one kept.
+    """
+
+    def __init__(self, similarity_threshold=DEFAULT_THRESHOLD, near_duplicates=True):
+        self.digests = {}
+        self.records = []  # (source file, row, title) of every kept record
+        self.near_index = NearDuplicateIndex(threshold=similarity_threshold) if near_duplicates else None
+
+    # Returns (canonical record number, matched key kind, similarity) or None after keeping the record
+    def match_or_add(self, source, row_number, row):
+        keys = record_keys(row)
+        digests = [(kind, key_digest(kind, value)) for kind, value in keys]
+        for kind, digest in digests:
+            if digest in self.digests:
+                return self.digests[digest], kind, 1.0
+        abstract = _text(row.get("Abstract Note"))
+        record = len(self.records)
+        if self.near_index is not None and abstract:
+            near = self.near_index.match_or_add(record, abstract)
+            if near:
+                return near[0], NEAR_DUPLICATE, near[1]
+        for _, digest in digests:
+            self.digests.setdefault(digest, record)
+        self.records.append((source, row_number, _text(row.get("Title"))))
+        return None
+
+
+def _read_chunks(path, chunk_rows):
+    return pd.read_csv(path, usecols=lambda column: column in COLUMNS, dtype=str, chunksize=chunk_rows)
+
+
+def dedupe_exports(folder, output_folder=None, similarity_threshold=DEFAULT_THRESHOLD, near_duplicates=True,
+                   chunk_rows=CHUNK_ROWS):
+    """
+    Stream every CSV export in the folder once, in name order, and write each record either
+    to unique_<file> (with its attachments listed in <file>.txt) or to the duplicates report
+    with the key that matched. Returns {"records", "unique", "matched": {key kind: count}}.
+    """
+    output_folder = output_folder or os.path.join(folder, "Unique")
+    os.makedirs(output_folder, exist_ok=True)
+    csv_files = sorted(f for f in os.listdir(folder) if f.endswith(".csv"))
+    index = DedupeIndex(similarity_threshold, near_duplicates)
+    summary = {"records": 0, "unique": 0, "matched": {kind: 0 for kind in KEY_KINDS + [NEAR_DUPLICATE]}}
+
+    with open(os.path.join(output_folder, "duplicates_report.csv"), "w", newline="", encoding="utf-8") as report_file, \
+            open(os.path.join(output_folder, "near_duplicates_report.csv"), "w", newline="",
+                 encoding="utf-8") as near_file:
+        report = csv.writer(report_file)
+        report.writerow(REPORT_COLUMNS)
+        near_report = csv.writer(near_file)
+        near_report.writerow(NEAR_REPORT_COLUMNS)
+        for file in csv_files:
+            output_csv_path = os.path.join(output_folder, f"unique_{file}")
+            attachments_seen = set()
+            row_number = 0
+            try:
+                with open(os.path.join(output_folder, f"{file}.txt"), "w", encoding="utf-8") as attachments:
+                    for chunk_number, chunk in enumerate(_read_chunks(os.path.join(folder, file), chunk_rows)):
+                        keep = []
+                        for row in chunk.to_dict("records"):
+                            row_number += 1
+                            match = index.match_or_add(file, row_number, row)
+                            keep.append(match is None)
+                            if match is None:
+                                attachment = _text(row.get("File Attachments"))
+                                if attachment and attachment not in attachments_seen:
+                                    attachments_seen.add(attachment)
+                                    attachments.write(attachment + "\n")
+                                continue
+                            canonical, kind, similarity = match
+                            canonical_source, canonical_row, canonical_title = index.records[canonical]
+                            summary["matched"][kind] += 1
+                            report.writerow([file, row_number, _text(row.get("Title")), canonical_source,
+                                             canonical_row, canonical_title, kind, round(similarity, 3)])
+                            if kind == NEAR_DUPLICATE:
+                                near_report.writerow([canonical_title, canonical_source, _text(row.get("Title")),
+                                                      file, round(similarity, 3)])
+                        chunk[keep].to_csv(output_csv_path, mode="w" if chunk_number == 0 else "a",
+                                           header=chunk_number == 0, index=False)
+                        summary["records"] += len(keep)
+                        summary["unique"] += sum(keep)
+            except Exception as e:
+                print(f"Error reading {file}: {e}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove duplicate records across Zotero CSV exports.")
+    parser.add_argument("folder", nargs="?", default=DEFAULT_FOLDER, help="Folder containing the CSV exports")
+    parser.add_argument("--output", help="Output folder (default: <folder>/Unique)")
+    parser.add_argument("--similarity-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Abstracts at least this similar (MinHash Jaccard estimate) are the same paper")
+    parser.add_argument("--no-near-duplicates", action="store_true", help="Only match on exact normalized keys")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    summary = dedupe_exports(args.folder, args.output, args.similarity_threshold,
+                             near_duplicates=not args.no_near_duplicates, chunk_rows=args.chunk_rows)
+    if not summary["records"]:
+        print("No valid CSV files found or no valid data loaded.")
+        return 1
+    print(f"{summary['records']} records, {summary['unique']} unique "
+          f"({time.perf_counter() - start:.1f}s). Duplicates by matched key:")
+    for kind, count in summary["matched"].items():
+        print(f"  {kind}: {count}")
+    print("Processing complete. Unique CSV files and text files have been saved.")
+    return 0
+
 
-# Folder containing CSV files
-folder_path = r"Zotero Files"
-output_folder = os.path.join(folder_path, "Unique")
-os.makedirs(output_folder, exist_ok=True)
-
-# List all CSV files in the folder
-csv_files = [f for f in os.listdir(folder_path) if f.endswith('.csv')]
-
-# Dictionary to store data from each file
-data_frames = {}
-
-# Load each CSV file into a DataFrame
-for file in csv_files:
-    file_path = os.path.join(folder_path, file)
-    try:
-        df = pd.read_csv(file_path, usecols=["Author", "Title", "Abstract Note", "File Attachments"], dtype=str)
-        df["Source File"] = file  # Track source file
-        data_frames[file] = df
-    except Exception as e:
-        print(f"Error reading {file}: {e}")
-
-# Ensure we have valid data before proceeding
-if not data_frames:
-    print("No valid CSV files found or no valid data loaded.")
-    exit()
-
-# Combine all data to find duplicates
-combined_df = pd.concat(data_frames.values(), ignore_index=True)
-
-# Remove duplicate rows based on Author, Title, and Abstract Note
-unique_df = combined_df.drop_duplicates(subset=["Abstract Note"], keep="first")
-
-# ["Author", "Title", "Abstract Note"]
-
-# Split back into separate DataFrames
-for file in csv_files:
-    unique_data = unique_df[unique_df["Source File"] == file].drop(columns=["Source File"])
-    
-    # Save unique data back to CSV
-    output_csv_path = os.path.join(output_folder, f"unique_{file}")
-    unique_data.to_csv(output_csv_path, index=False)
-
-    # Save unique File Attachments column to a text file
-    output_txt_path = os.path.join(output_folder, f"{file}.txt")
-    unique_data["File Attachments"].dropna().drop_duplicates().to_csv(output_txt_path, index=False, header=False)
-
-print("Processing complete. Unique CSV files and text files have been saved.")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
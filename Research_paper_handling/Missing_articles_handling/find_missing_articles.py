@@ -1,6 +1,11 @@
 import os
+import sys
 import chromadb
 
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from collection_ops import list_paper_ids
+
 # Define the folder path where original articles are stored
 original_articles_folder = "Data_Final"
 
@@ -11,10 +16,10 @@ def get_original_articles(folder_path):
 
 # Fetch uploaded articles from ChromaDB
 def get_uploaded_articles(collection_name="pdf_documents"):
-    """Retrieves document IDs from ChromaDB."""
+    """Retrieves paper IDs (one per article, not per chunk) from ChromaDB."""
     client = chromadb.PersistentClient(path="chroma_db")  # Update path if needed
     collection = client.get_collection(collection_name)
-    uploaded_ids = collection.get()["ids"]  # Extract stored document IDs
+    uploaded_ids = list_paper_ids(collection)  # Stream stored paper IDs from metadata, page by page
     return set(uploaded_ids)
 
 # Identify missing articles
@@ -1,6 +1,14 @@
 import os
+import sys
 import chromadb
 
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from bibliographic import paper_records
+from bm25_index import index_for
+from embedding_service import get_embedding_service
+from extraction_cache import cached_extract
+
 # Define paths
 original_articles_folder = "Data_Final"
 missing_articles_file = "missing_articles.txt"
@@ -8,6 +16,7 @@ missing_articles_file = "missing_articles.txt"
 # Initialize ChromaDB client
 client = chromadb.PersistentClient(path="chroma_db")  # Update path if needed
 collection = client.get_collection("pdf_documents")  # Update collection name if necessary
+embedder = get_embedding_service()
 
 # Read missing article filenames
 with open(missing_articles_file, "r", encoding="utf-8") as f:
@@ -15,10 +24,9 @@ with open(missing_articles_file, "r", encoding="utf-8") as f:
 
 # Function to read article content
 def read_article_content(file_path):
-    """Reads and returns the content of an article."""
+    """Reads and returns the text content of an article PDF."""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+        return cached_extract(file_path, "pypdf2")
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return None
@@ -30,8 +38,11 @@ for article in missing_articles:
     if os.path.exists(article_path):  # Ensure the file exists before processing
         content = read_article_content(article_path)
         if content:
-            collection.add(ids=[article], documents=[content])  # Upload to ChromaDB
-            print(f"Uploaded: {article}")
+            ids, documents, metadatas = paper_records(article, content, {"filename": article})
+            collection.add(ids=ids, documents=documents, metadatas=metadatas,
+                           embeddings=embedder.embed_documents(documents))  # Upload to ChromaDB
+            index_for(collection).add(ids, documents, metadatas)  # Keep keyword search in step
+            print(f"Uploaded: {article} ({len(ids)} chunks)")
         else:
             print(f"Skipping {article} due to read error.")
     else:
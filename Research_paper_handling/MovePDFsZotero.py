@@ -1,29 +1,226 @@
-import shutil
 import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Text file listing one PDF path per line (the <file>.txt written by DuplicatesZotero.py)
+DEFAULT_LIST_FILE = r"Research_paper_handling/list_ref.txt"
+DEFAULT_DESTINATION = r"Research_paper_handling/Research_papers"
+# Export prefix added to every file name; bibliographic.source_database() reads it back
+DEFAULT_PREFIX = os.getenv("COLLECT_PDF_PREFIX", "PubMed_")
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # Copies are I/O-bound, so more threads than cores
+MANIFEST_NAME = ".collect_manifest.json"
+SAVE_EVERY = 50  # Manifest writes during a run, so an interrupted run loses little progress
+
+# "auto" tries a reflink, then a hardlink, then a plain copy
+PLACE_METHODS = {"auto": ["reflink", "hardlink", "copy"], "reflink": ["reflink"], "hardlink": ["hardlink"],
+                 "copy": ["copy"]}
+_FICLONE = 0x40049409  # Linux ioctl: share the source's blocks copy-on-write (Btrfs, XFS, ...)
+
+
+def _reflink(source, target):
+    import fcntl
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+_PLACERS = {"reflink": _reflink, "hardlink": os.link, "copy": shutil.copy2}
+
+
+# Hash a file in 1 MB blocks so large PDFs are never fully loaded
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Resume manifest: {"sources": {path: size, mtime, sha256}, "targets": {name: sha256, size, mtime, sources}}
+def load_manifest(path):
+    manifest = {"sources": {}, "targets": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest.update(json.load(f))
+    return manifest
+
+
+# Written to a temporary file and swapped in, so an interrupted save never corrupts the manifest
+def save_manifest(path, manifest):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+# Put a copy of source at target via a temporary name, so an interrupted run never leaves a partial PDF
+def place_file(source, target, mode="auto"):
+    partial = target + ".part"
+    for method in PLACE_METHODS[mode]:
+        if os.path.lexists(partial):
+            os.remove(partial)
+        try:
+            _PLACERS[method](source, partial)
+        except (OSError, ImportError):
+            continue  # Different filesystem or no reflink support: try the next method
+        os.replace(partial, target)
+        return method
+    if os.path.lexists(partial):
+        os.remove(partial)
+    raise OSError(f"Could not {mode} {source} to {target}")
+
+
+def read_list(list_file):
+    with open(list_file, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]  # Remove empty lines
+
+
+def _stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+# Content hash of a source, reusing the manifest's when size and mtime are unchanged
+def _source_hash(path, known):
+    size, mtime = _stat(path)
+    if known and known["size"] == size and known["mtime"] == mtime:
+        return known["sha256"], size, mtime
+    return file_sha256(path), size, mtime
+
+
+# sha256 of a file already in the destination, trusting the manifest while the file is untouched
+def _target_hash(path, entry):
+    if entry and (entry["size"], entry["mtime"]) == _stat(path):
+        return entry["sha256"]
+    return file_sha256(path)
+
+
+def _target_name(prefix, source, sha256, taken, targets):
+    name = f"{prefix}{os.path.basename(source)}"
+    # A source whose content changed keeps its name; another paper with the same file name does not
+    if taken.get(name, sha256) != sha256 and source not in targets.get(name, {}).get("sources", []):
+        stem, ext = os.path.splitext(name)
+        name = f"{stem}_{sha256[:8]}{ext}"  # Same file name, different paper
+    return name
+
+
+def collect_pdfs(pdf_paths, destination, prefix=DEFAULT_PREFIX, workers=DEFAULT_WORKERS, mode="auto",
+                 manifest_path=None):
+    """
+    Gather PDFs into destination as <prefix><file name>, hashing and placing them in parallel.
+    A PDF whose bytes are already in the destination, under any name or prefix, is not copied
+    again. The manifest (source hashes and what each target holds) makes re-runs skip
+    everything already done. Returns {"placed": {method: count}, "unchanged", "duplicates", "missing"}.
+    """
+    os.makedirs(destination, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(destination, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    sources, targets = manifest["sources"], manifest["targets"]
+    report = {"placed": {}, "unchanged": 0, "duplicates": [], "missing": []}
+
+    existing = []
+    for pdf in dict.fromkeys(os.path.abspath(path) for path in pdf_paths):
+        if os.path.isfile(pdf):
+            existing.append(pdf)
+        else:
+            report["missing"].append(pdf)
+            print(f"File not found: {pdf}")
+
+    # Hash sources and recorded targets in parallel; unchanged files are not re-read
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        source_futures = {pdf: executor.submit(_source_hash, pdf, sources.get(pdf)) for pdf in existing}
+        target_futures = {name: executor.submit(_target_hash, os.path.join(destination, name), entry)
+                          for name, entry in targets.items() if os.path.isfile(os.path.join(destination, name))}
+        for pdf, future in source_futures.items():
+            sha256, size, mtime = future.result()
+            sources[pdf] = {"sha256": sha256, "size": size, "mtime": mtime}
+        for name in list(targets):
+            if name not in target_futures:
+                del targets[name]  # Removed from the destination since the last run
+            elif target_futures[name].result() != targets[name]["sha256"]:
+                # Edited in place (a hardlinked target changes with its source)
+                size, mtime = _stat(os.path.join(destination, name))
+                targets[name].update(sha256=target_futures[name].result(), size=size, mtime=mtime)
 
-# Path to the text file containing the list of PDF paths
-txt_file_path = r"Research_paper_handling/list_ref.txt"  # Change this to the correct path
+    # Plan in list order: the first path with given bytes is the one kept
+    taken = {name: entry["sha256"] for name, entry in targets.items()}
+    by_content = {entry["sha256"]: name for name, entry in targets.items()}
+    to_place = []
+    pending_duplicates = {}  # Target not placed yet -> other sources with the same bytes
+    for pdf in existing:
+        sha256 = sources[pdf]["sha256"]
+        if sha256 in by_content:
+            name = by_content[sha256]
+            if name in targets and pdf in targets[name]["sources"]:
+                report["unchanged"] += 1
+            else:
+                report["duplicates"].append((pdf, name))
+                print(f"Duplicate: {pdf} has the same content as {name}")
+                if name in targets:
+                    targets[name]["sources"].append(pdf)
+                else:
+                    pending_duplicates.setdefault(name, []).append(pdf)
+            continue
+        name = _target_name(prefix, pdf, sha256, taken, targets)
+        target = os.path.join(destination, name)
+        if name not in targets and os.path.isfile(target) and file_sha256(target) == sha256:
+            report["unchanged"] += 1  # Copied by an earlier run that kept no manifest
+            size, mtime = _stat(target)
+            targets[name] = {"sha256": sha256, "size": size, "mtime": mtime, "sources": [pdf]}
+        else:
+            to_place.append((pdf, name))
+        taken[name] = sha256
+        by_content[sha256] = name
 
+    # Place in parallel, saving the manifest as files land so an interrupted run can resume
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(place_file, pdf, os.path.join(destination, name), mode): (pdf, name)
+                       for pdf, name in to_place}
+            for done, future in enumerate(as_completed(futures), start=1):
+                pdf, name = futures[future]
+                try:
+                    method = future.result()
+                except OSError as e:
+                    print(f"Error placing {pdf}: {e}")
+                    continue
+                size, mtime = _stat(os.path.join(destination, name))
+                targets[name] = {"sha256": sources[pdf]["sha256"], "size": size, "mtime": mtime,
+                                 "sources": [pdf] + pending_duplicates.get(name, [])}
+                report["placed"][method] = report["placed"].get(method, 0) + 1
+                print(f"{method.capitalize()}: {pdf} -> {name}")
+                if done % SAVE_EVERY == 0:
+                    save_manifest(manifest_path, manifest)
+    finally:
+        save_manifest(manifest_path, manifest)
+    return report
 
-# Destination folder where PDFs will be copied
-destination_folder = r"Research_paper_handling/Research_papers"  # Change to your desired path
 
-# Ensure the destination folder exists
-os.makedirs(destination_folder, exist_ok=True)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect the PDFs listed in a text file into one folder.")
+    parser.add_argument("list_file", nargs="?", default=DEFAULT_LIST_FILE, help="Text file with one PDF path per line")
+    parser.add_argument("destination", nargs="?", default=DEFAULT_DESTINATION)
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="Prefix for the copied file names, e.g. Scopus_")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--mode", choices=sorted(PLACE_METHODS), default="auto",
+                        help="auto uses a reflink or hardlink when the folders share a filesystem, else copies")
+    parser.add_argument("--manifest", help=f"Resume manifest (default: <destination>/{MANIFEST_NAME})")
+    args = parser.parse_args(argv)
 
-# Read the file paths from the text file
-with open(txt_file_path, "r", encoding="utf-8") as file:
-    pdf_files = [line.strip() for line in file if line.strip()]  # Remove empty lines
+    report = collect_pdfs(read_list(args.list_file), args.destination, args.prefix, args.workers, args.mode,
+                          args.manifest)
+    placed = ", ".join(f"{count} by {method}" for method, count in report["placed"].items()) or "none"
+    print(f"Placed: {placed}. Unchanged: {report['unchanged']}. "
+          f"Identical to another PDF: {len(report['duplicates'])}. Not found: {len(report['missing'])}.")
+    print("Copying process completed.")
+    return 0
 
-# Copy each PDF to the destination folder with "EBSCOhost_" prefix
-for pdf in pdf_files:
-    if os.path.isfile(pdf):  # Check if the file exists
-        file_name = os.path.basename(pdf)  # Extract the original file name
-        new_file_name = f"PubMed_{file_name}"  # Add the prefix
-        new_file_path = os.path.join(destination_folder, new_file_name)  # New file path
-        shutil.copy(pdf, new_file_path)  # Copy with new name
-        print(f"Copied: {pdf} -> {new_file_path}")
-    else:
-        print(f"File not found: {pdf}")
 
-print("Copying process completed.")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import hashlib
+
+import streamlit as st
+
+from bibliographic import DATABASES, UNKNOWN_DATABASE, metadata_filter
+from collection_ops import list_paper_ids
+from metrics import get_metrics, LLM_REQUESTS, LLM_TOKENS, LLM_RETRIES
+
+
+# One Chroma client per database path for the whole server process, not one per rerun
+@st.cache_resource
+def get_chroma_client(path="./chroma_db"):
+    import chromadb
+    return chromadb.PersistentClient(path=path)
+
+
+# Paper ids of a collection, scanned once and reused until invalidate_paper_ids()
+def cached_paper_ids(collection):
+    key = f"paper_ids:{collection.name}"
+    if key not in st.session_state:
+        st.session_state[key] = sorted(list_paper_ids(collection))
+    return st.session_state[key]
+
+
+# Call after anything that adds or deletes papers
+def invalidate_paper_ids(collection):
+    st.session_state.pop(f"paper_ids:{collection.name}", None)
+
+
+# Content hash of an uploaded file, so the same upload is recognised across reruns
+def upload_key(uploaded_file):
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+# Uploads already ingested in this session, as {content hash: filename}
+def ingested_uploads():
+    return st.session_state.setdefault("ingested_uploads", {})
+
+
+# Source database and publication year inputs, returned as a Chroma `where` filter (None = everything)
+def metadata_filter_inputs(key="filter"):
+    with st.expander("Restrict to source databases / publication years"):
+        databases = st.multiselect("Source databases", DATABASES + [UNKNOWN_DATABASE], key=f"{key}_databases")
+        year_from = st.number_input("From year (0 = no limit)", min_value=0, max_value=2100, value=0,
+                                    key=f"{key}_year_from")
+        year_to = st.number_input("To year (0 = no limit)", min_value=0, max_value=2100, value=0,
+                                  key=f"{key}_year_to")
+        st.caption("Once a year is set, papers whose year could not be read from the PDF are left out.")
+    return metadata_filter(databases, year_from, year_to)
+
+
+# Sidebar panel with time per pipeline stage and LLM usage; also refreshes the Prometheus file
+def show_metrics_panel():
+    metrics = get_metrics()
+    with st.sidebar.expander("Timings"):
+        rows = metrics.stage_summary()
+        if rows:
+            st.dataframe(rows)
+        else:
+            st.write("Nothing has been timed yet.")
+        st.write(f"LLM requests: {metrics.counter_total(LLM_REQUESTS)}, "
+                 f"tokens in: {metrics.counter_total(LLM_TOKENS, direction='in')}, "
+                 f"tokens out: {metrics.counter_total(LLM_TOKENS, direction='out')}, "
+                 f"retries: {metrics.counter_total(LLM_RETRIES)}")
+        st.caption("Totals since the server started, across all sessions.")
+    metrics.export()
@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction_cache import EXTRACTORS, get_default_cache
+from ingest_manifest import file_sha256
+from keyword_matcher import KeywordMatcher, parse_criteria
+from near_duplicates import NearDuplicateIndex, DEFAULT_THRESHOLD
+from pdf_ingestion import extract_text, list_pdfs, DEFAULT_WORKERS
+from metrics import get_metrics, stage_timer
+from screening import (screen_papers, RateLimiter, SCREENING_MODEL, DEFAULT_CONCURRENCY, DEFAULT_RPM, DEFAULT_TPM,
+                       TRIAGE_MODEL, TRIAGE_API_BASE, DEFAULT_EXCLUDE_CONFIDENCE, DEFAULT_INCLUDE_CONFIDENCE)
+from batched_screening import (screen_papers_batched, paper_summaries, pack_batches, write_jobs, read_job_results,
+                               DEFAULT_BATCH_TOKENS, DEFAULT_BATCH_PAPERS, STAGE as BATCHED_STAGE)
+
+logger = logging.getLogger(__name__)
+
+# Journal statuses that count as finished; "error" entries are retried on the next run
+DONE_STATUSES = ("screened", "duplicate", "excluded", "empty")
+OUTPUT_COLUMNS = ["filename", "status", "title", "decision", "stage", "reason", "abstract",
+                  "duplicate_of", "similarity", "excluded_by", "sha256"]
+
+
+class ScreeningJournal:
+    """
+    Append-only JSONL record of per-paper results. Every line is flushed and fsynced before
+    the next paper is reported, so a crash loses at most the paper in flight.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut short by a crash
+                    self.entries[entry["filename"]] = entry  # Later lines win
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.entries[entry["filename"]] = entry
+
+    # Finished entry for this exact file and run configuration, if any
+    def completed(self, filename, sha256, run_key):
+        entry = self.entries.get(filename)
+        if entry and entry["sha256"] == sha256 and entry["run_key"] == run_key and entry["status"] in DONE_STATUSES:
+            return entry
+        return None
+
+    def close(self):
+        self._file.close()
+
+
+# Results only carry over between runs with the same criteria, exclusions, model and screening mode
+def run_key(criteria, exclusions, model, duplicate_threshold, mode=None):
+    settings = [criteria, sorted(exclusions), model, duplicate_threshold]
+    if mode is not None:
+        settings.append(sorted(mode.items()))
+    payload = json.dumps(settings)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# Extract every PDF in a process pool, yielding (path, text, error) in folder order
+def extract_all(pdf_paths, extractor, workers):
+    cache = get_default_cache()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(extract_text, path, cache.cache_dir, extractor) for path in pdf_paths]
+        for path, future in zip(pdf_paths, futures):
+            try:
+                text, hit = future.result()
+                cache.record(hit)
+                yield path, text, None
+            except Exception as e:
+                yield path, "", e
+    cache.evict()
+
+
+def screen_folder(folder, criteria, output, journal_path=None, exclusions=(), duplicate_threshold=DEFAULT_THRESHOLD,
+                  extractor="pypdf2", workers=DEFAULT_WORKERS, concurrency=DEFAULT_CONCURRENCY,
+                  rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, model=SCREENING_MODEL, restart=False, bypass_cache=None,
+                  cascade=None, batch_size=None, job_file=None, job_results=None):
+    """
+    Extract, dedupe, exclude and screen every PDF in a folder, journaling each paper as it
+    finishes. Re-running with the same arguments skips papers the journal already has, so
+    only unfinished papers are sent to the model. Returns the number of papers screened now.
+    With cascade (screen_paper_cascade keyword arguments) papers are triaged on title and
+    abstract first and the journal records which stage decided each one.
+    With batch_size, titles and abstracts of up to batch_size papers share one request.
+    With job_file the batched requests are written there instead of sent; running again with
+    job_results (the replayed results file) journals the answers and writes unanswered papers
+    to <job_file>.retry.jsonl.
+    """
+    journal_path = journal_path or os.path.splitext(output)[0] + ".journal.jsonl"
+    if restart and os.path.exists(journal_path):
+        os.remove(journal_path)
+    journal = ScreeningJournal(journal_path)
+    batched = bool(batch_size or job_file)
+    batch_size = batch_size or DEFAULT_BATCH_PAPERS
+    key = run_key(criteria, exclusions, model, duplicate_threshold,
+                  {"batched": True} if batched else cascade)
+    matcher = KeywordMatcher(exclusions) if exclusions else None
+    duplicate_index = NearDuplicateIndex(threshold=duplicate_threshold)
+
+    pdf_paths = list_pdfs(folder)
+    to_screen = []
+    hashes = {}
+    resumed = 0
+    try:
+        # Dedupe runs over every paper in folder order, finished or not, so resumed runs
+        # keep the same canonical copies as the original run
+        for path, text, error in extract_all(pdf_paths, extractor, workers):
+            filename = os.path.basename(path)
+            sha256 = file_sha256(path)
+            entry = {"filename": filename, "sha256": sha256, "run_key": key}
+            if error is not None:
+                logger.error(f"Extraction failed for {filename}: {error}")
+                journal.append({**entry, "status": "error", "reason": f"extraction failed: {error}"})
+                continue
+            duplicate = duplicate_index.match_or_add(filename, text) if text else None
+            if journal.completed(filename, sha256, key):
+                resumed += 1
+                continue
+            hits = matcher.count(text) if matcher and text and not duplicate else {}
+            if not text:
+                journal.append({**entry, "status": "empty"})
+            elif duplicate:
+                journal.append({**entry, "status": "duplicate", "duplicate_of": duplicate[0],
+                                "similarity": round(duplicate[1], 3)})
+            elif hits:
+                journal.append({**entry, "status": "excluded", "excluded_by": ", ".join(sorted(hits))})
+            else:
+                to_screen.append((filename, text))
+                hashes[filename] = sha256
+        logger.info(f"{len(pdf_paths)} PDFs: {resumed} already in the journal, {len(to_screen)} to screen")
+
+        if job_file and not job_results:
+            summaries, empty = paper_summaries(to_screen)
+            for filename in empty:
+                journal.append({"filename": filename, "sha256": hashes[filename], "run_key": key,
+                                "status": "error", "reason": "no title or abstract text to screen"})
+            jobs = write_jobs(pack_batches(summaries, DEFAULT_BATCH_TOKENS, batch_size), criteria, job_file, model)
+            logger.info(f"Wrote {jobs} screening requests for {len(summaries)} papers to {job_file}")
+            return 0
+
+        limiter = RateLimiter(rpm, tpm)
+        if job_file:
+            results, errors = read_job_results(job_file, job_results, os.path.splitext(job_file)[0] + ".retry.jsonl")
+            outcomes = [(filename, results.get(filename),
+                         None if filename in results else errors.get(filename, "no result for this paper"))
+                        for filename, _ in to_screen]
+        elif batched:
+            outcomes = screen_papers_batched(to_screen, criteria, concurrency, limiter, model,
+                                             bypass_cache=bypass_cache, max_papers=batch_size)
+        else:
+            outcomes = screen_papers(to_screen, criteria, concurrency, limiter, model, bypass_cache=bypass_cache,
+                                     cascade=cascade)
+        with stage_timer("screening") as fields:
+            fields["papers"] = len(to_screen)
+            for done, (filename, result, error) in enumerate(outcomes, start=1):
+                entry = {"filename": filename, "sha256": hashes[filename], "run_key": key}
+                if error is not None:
+                    logger.error(f"Screening failed for {filename}: {error}")
+                    journal.append({**entry, "status": "error", "reason": str(error)})
+                    continue
+                title, abstract, decision, reason = result[:4]
+                if decision == "Error":
+                    # Unparseable answer: journaled as an error so the next run screens the paper again
+                    logger.error(f"Could not parse the screening answer for {filename}")
+                    journal.append({**entry, "status": "error", "title": title,
+                                    "reason": "could not parse the model's answer"})
+                    continue
+                if batched:
+                    stage = BATCHED_STAGE
+                else:
+                    stage = result[4] if cascade is not None else "full_text"
+                journal.append({**entry, "status": "screened", "title": title, "abstract": abstract,
+                                "decision": decision, "stage": stage, "reason": reason})
+                logger.info(f"[{done}/{len(to_screen)}] {filename}: {decision}")
+    finally:
+        journal.close()
+        get_metrics().export()
+
+    current = [journal.entries[os.path.basename(path)] for path in pdf_paths
+               if os.path.basename(path) in journal.entries]
+    write_results(current, output)
+    return len(to_screen)
+
+
+# Write journal entries to CSV, or Parquet when the output ends in .parquet
+def write_results(entries, output):
+    import pandas as pd
+    frame = pd.DataFrame(entries).reindex(columns=OUTPUT_COLUMNS)
+    if output.endswith(".parquet"):
+        frame.to_parquet(output, index=False)
+    else:
+        frame.to_csv(output, index=False)
+    logger.info(f"Wrote {len(frame)} rows to {output}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen a folder of PDFs without the Streamlit UI. "
+                                                 "Interrupted runs resume from the journal.")
+    parser.add_argument("folder", help="Folder containing the PDFs")
+    criteria = parser.add_mutually_exclusive_group(required=True)
+    criteria.add_argument("--criteria", help="Inclusion criteria text")
+    criteria.add_argument("--criteria-file", help="File containing the inclusion criteria")
+    parser.add_argument("--exclude", default="", help="Comma-separated exclusion keywords")
+    parser.add_argument("--output", default="screening_results.csv", help="Results file (.csv or .parquet)")
+    parser.add_argument("--journal", help="Checkpoint journal (default: <output>.journal.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the journal and screen everything again")
+    parser.add_argument("--duplicate-threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--extractor", choices=sorted(EXTRACTORS), default="pypdf2")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Extraction processes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent LLM requests")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_RPM, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TPM, help="Tokens per minute limit")
+    parser.add_argument("--model", default=SCREENING_MODEL)
+    parser.add_argument("--bypass-cache", action="store_true", help="Always re-query the model")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--cascade", action="store_true",
+                      help="Screen title/abstract first and send full text only for papers not confidently excluded")
+    mode.add_argument("--batch-size", type=int,
+                      help="Screen titles/abstracts of up to this many papers per request (JSON answers)")
+    parser.add_argument("--job-file", help="Write batched requests to this JSONL file instead of sending them "
+                                           "(replay it with batched_screening.py)")
+    parser.add_argument("--job-results", help="With --job-file: read the replayed results and journal them")
+    parser.add_argument("--triage-model", default=TRIAGE_MODEL, help="Model for the title/abstract pass")
+    parser.add_argument("--triage-api-base", default=TRIAGE_API_BASE,
+                        help="OpenAI-compatible endpoint for the title/abstract pass (e.g. http://localhost:11434/v1)")
+    parser.add_argument("--exclude-confidence", type=float, default=DEFAULT_EXCLUDE_CONFIDENCE,
+                        help="Title/abstract exclusions at or above this confidence (0-1) are final")
+    parser.add_argument("--include-confidence", type=float, default=DEFAULT_INCLUDE_CONFIDENCE,
+                        help="Title/abstract inclusions at or above this confidence skip the full text "
+                             "(default: always check the full text)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} is not a directory")
+    if args.criteria_file:
+        with open(args.criteria_file, "r", encoding="utf-8") as f:
+            args.criteria = f.read().strip()
+
+    if args.job_results and not args.job_file:
+        parser.error("--job-results needs the --job-file it answers")
+    if args.job_file and args.cascade:
+        parser.error("--job-file screens titles/abstracts in batches and cannot be combined with --cascade")
+    cascade = None
+    if args.cascade:
+        cascade = {"triage_model": args.triage_model, "triage_api_base": args.triage_api_base,
+                   "exclude_confidence": args.exclude_confidence, "include_confidence": args.include_confidence}
+
+    screen_folder(args.folder, args.criteria, args.output, journal_path=args.journal,
+                  exclusions=parse_criteria(args.exclude), duplicate_threshold=args.duplicate_threshold,
+                  extractor=args.extractor, workers=args.workers, concurrency=args.concurrency,
+                  rpm=args.rpm, tpm=args.tpm, model=args.model, restart=args.restart,
+                  bypass_cache=True if args.bypass_cache else None, cascade=cascade, batch_size=args.batch_size,
+                  job_file=args.job_file, job_results=args.job_results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
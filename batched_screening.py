@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import openai
+
+from metrics import get_metrics, SCREENING_BATCH_SPLITS
+from screening import (cached_completion, call_with_retry, estimate_tokens, triage_fields, RateLimiter,
+                       SCREENING_MODEL, DEFAULT_CONCURRENCY)
+
+# Several papers' titles and abstracts share one request (and one copy of the instructions)
+DEFAULT_BATCH_TOKENS = int(os.getenv("SCREENING_BATCH_TOKENS", "6000"))
+DEFAULT_BATCH_PAPERS = int(os.getenv("SCREENING_BATCH_PAPERS", "10"))
+ANSWER_TOKENS_PER_PAPER = 80  # Reserved per paper for its JSON record
+DECISIONS = ("Include", "Exclude")
+STAGE = "batched_title_abstract"
+
+BATCH_SYSTEM_PROMPT = ("You screen research papers for a systematic review using only their titles and "
+                       "abstracts. Answer with JSON only.")
+
+
+class MalformedBatchError(ValueError):
+    """The model's answer to a batch was not a JSON array of valid screening records."""
+
+
+# (key, title, abstract) for every paper, plus the keys of papers with no text to screen
+def paper_summaries(papers):
+    summaries, empty = [], []
+    for key, text in papers:
+        fields = triage_fields(text or "")
+        if fields:
+            summaries.append((key, *fields))
+        else:
+            empty.append(key)
+    return summaries, empty
+
+
+def _paper_block(number, title, abstract):
+    return f"Paper {number}\nTitle: {title}\nAbstract: {abstract}"
+
+
+# Greedily group summaries so each request stays under budget_tokens and max_papers
+def pack_batches(summaries, budget_tokens=DEFAULT_BATCH_TOKENS, max_papers=DEFAULT_BATCH_PAPERS):
+    batches, batch, used = [], [], 0
+    for summary in summaries:
+        cost = estimate_tokens(_paper_block(len(batch) + 1, summary[1], summary[2])) + ANSWER_TOKENS_PER_PAPER
+        if batch and (used + cost > budget_tokens or len(batch) >= max_papers):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(summary)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_batch_messages(batch, criteria):
+    papers = "\n\n".join(_paper_block(number, title, abstract)
+                         for number, (_, title, abstract) in enumerate(batch, start=1))
+    return [{
+        "role": "system",
+        "content": BATCH_SYSTEM_PROMPT
+    }, {
+        "role": "user",
+        "content": f"Inclusion Criteria: {criteria}\n\n"
+                   f"{papers}\n\n"
+                   f"Return a JSON array with exactly one object per paper:\n"
+                   f'[{{"id": <paper number>, "title": "<title>", "decision": "Include" or "Exclude", '
+                   f'"reason": "<brief reason>"}}]'
+    }]
+
+
+# One record of the answer array, validated: (id, title, decision, reason) or None
+def _validate_record(record, expected_ids):
+    if not isinstance(record, dict):
+        return None
+    try:
+        number = int(record.get("id"))
+    except (TypeError, ValueError):
+        return None
+    decision = str(record.get("decision", "")).strip().capitalize()
+    title, reason = record.get("title", ""), record.get("reason", "")
+    if number not in expected_ids or decision not in DECISIONS or not isinstance(title, str) \
+            or not isinstance(reason, str):
+        return None
+    return number, title.strip(), decision, reason.strip()
+
+
+# Parse the answer to a batch into {paper number: (title, decision, reason)} for every valid record
+def parse_batch_response(content, expected_ids):
+    """
+    Accepts the array bare, inside a ``` code fence or wrapped in a one-key object.
+    Raises MalformedBatchError when there is no JSON array at all; invalid or duplicate
+    records are left out, so the caller can re-send just the papers they belong to.
+    """
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", (content or "").strip())
+    try:
+        records = json.loads(text)
+    except ValueError:
+        start, end = text.find("["), text.rfind("]")
+        try:
+            records = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except ValueError:
+            records = None
+    if isinstance(records, dict) and len(records) == 1:
+        records = next(iter(records.values()))
+    if not isinstance(records, list):
+        raise MalformedBatchError("answer is not a JSON array")
+    answered = {}
+    for record in records:
+        valid = _validate_record(record, expected_ids)
+        if valid and valid[0] not in answered:
+            answered[valid[0]] = valid[1:]
+    return answered
+
+
+# Papers to re-send after a bad answer: the unanswered ones together, or split in half if none were answered
+def split_unanswered(batch, unanswered):
+    if len(unanswered) < len(batch):
+        return [unanswered]
+    half = (len(batch) + 1) // 2
+    return [part for part in (batch[:half], batch[half:]) if part]
+
+
+# Match a batch's answer back to its papers: ({key: (title, abstract, decision, reason)}, unanswered)
+def match_answers(batch, content):
+    try:
+        answered = parse_batch_response(content, range(1, len(batch) + 1))
+    except MalformedBatchError:
+        answered = {}
+    results, unanswered = {}, []
+    for number, (key, title, abstract) in enumerate(batch, start=1):
+        if number in answered:
+            answer_title, decision, reason = answered[number]
+            results[key] = (answer_title or title, abstract, decision, reason)
+        else:
+            unanswered.append((key, title, abstract))
+    return results, unanswered
+
+
+def screen_batch(batch, criteria, limiter=None, model=SCREENING_MODEL, cache=None, bypass_cache=None):
+    """
+    Screen a batch of (key, title, abstract) in one request. Returns (results, errors) keyed
+    by paper. Papers without a valid record in the answer are re-sent in smaller batches until
+    they are answered or fail on their own.
+    """
+    messages = build_batch_messages(batch, criteria)
+    content = cached_completion(model, messages, limiter, cache, bypass_cache, "batch_screening",
+                                allowance=ANSWER_TOKENS_PER_PAPER * len(batch),
+                                validate=lambda answer: not match_answers(batch, answer)[1])
+    results, unanswered = match_answers(batch, content)
+    errors = {}
+    if unanswered and len(batch) == 1:
+        errors[batch[0][0]] = MalformedBatchError(f"no valid screening record in the answer: {content[:200]!r}")
+    elif unanswered:
+        for part in split_unanswered(batch, unanswered):
+            get_metrics().inc(SCREENING_BATCH_SPLITS)
+            part_results, part_errors = screen_batch(part, criteria, limiter, model, cache, bypass_cache)
+            results.update(part_results)
+            errors.update(part_errors)
+    return results, errors
+
+
+# Batched counterpart of screening.screen_papers: yields (key, (title, abstract, decision, reason), error)
+def screen_papers_batched(papers, criteria, concurrency=DEFAULT_CONCURRENCY, limiter=None, model=SCREENING_MODEL,
+                          bypass_cache=None, budget_tokens=DEFAULT_BATCH_TOKENS, max_papers=DEFAULT_BATCH_PAPERS):
+    """
+    Titles and abstracts are parsed locally and packed into requests of at most max_papers
+    papers and budget_tokens tokens; up to `concurrency` batches are in flight at once.
+    """
+    limiter = limiter or RateLimiter()
+    summaries, empty = paper_summaries(papers)
+    for key in empty:
+        yield key, None, MalformedBatchError("no title or abstract text to screen")
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(screen_batch, batch, criteria, limiter, model, None, bypass_cache): batch
+            for batch in pack_batches(summaries, budget_tokens, max_papers)
+        }
+        for future in as_completed(futures):
+            try:
+                results, errors = future.result()
+            except Exception as e:
+                results, errors = {}, {key: e for key, _, _ in futures[future]}
+            for key, result in results.items():
+                yield key, result, None
+            for key, error in errors.items():
+                yield key, None, error
+
+
+# Sidecar file mapping each job's custom_id back to its papers
+def _papers_path(jobs_path):
+    return os.path.splitext(jobs_path)[0] + ".papers.json"
+
+
+def write_jobs(batches, criteria, jobs_path, model=SCREENING_MODEL):
+    """
+    Write one OpenAI Batch API style request line per batch instead of sending it, so large
+    runs can be queued, replayed later (replay_jobs) and read back (read_job_results).
+    """
+    batch_papers = {}
+    with open(jobs_path, "w", encoding="utf-8") as f:
+        for index, batch in enumerate(batches):
+            custom_id = f"screen-{index:05d}"
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                                "body": {"model": model, "messages": build_batch_messages(batch, criteria)}}) + "\n")
+            batch_papers[custom_id] = [list(summary) for summary in batch]
+    with open(_papers_path(jobs_path), "w", encoding="utf-8") as f:
+        json.dump({"criteria": criteria, "model": model, "batches": batch_papers}, f)
+    return len(batch_papers)
+
+
+def _read_jsonl(path):
+    entries = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash
+    return entries
+
+
+def replay_jobs(jobs_path, results_path, api_base=None, concurrency=DEFAULT_CONCURRENCY, limiter=None):
+    """
+    Send every job in jobs_path to an OpenAI-compatible endpoint (api_base, e.g. a local
+    stand-in) and append Batch API style result lines to results_path. Jobs that already have
+    a successful result are skipped, so an interrupted replay picks up where it stopped.
+    """
+    done = {entry["custom_id"] for entry in _read_jsonl(results_path) if entry.get("response")}
+    jobs = [job for job in _read_jsonl(jobs_path) if job["custom_id"] not in done]
+    limiter = limiter or RateLimiter()
+    params = {"api_base": api_base} if api_base else {}
+
+    def send(job):
+        body = job["body"]
+        limiter.acquire(estimate_tokens("".join(message["content"] for message in body["messages"])))
+        return call_with_retry(lambda: openai.ChatCompletion.create(**body, **params))
+
+    with open(results_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(send, job): job["custom_id"] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                entry = {"custom_id": futures[future], "response": {"status_code": 200, "body": future.result()},
+                         "error": None}
+            except Exception as e:
+                entry = {"custom_id": futures[future], "response": None, "error": {"message": str(e)}}
+            out.write(json.dumps(entry) + "\n")
+            out.flush()
+    return len(jobs)
+
+
+def read_job_results(jobs_path, results_path, retry_jobs_path=None):
+    """
+    Match a results file back to the papers of each job: returns (results, errors) keyed by
+    paper. Unanswered papers are split the same way screen_batch splits them and, with
+    retry_jobs_path, written out as a new job file to replay.
+    """
+    with open(_papers_path(jobs_path), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    responses = {entry["custom_id"]: entry for entry in _read_jsonl(results_path)}
+    results, errors, retry_batches = {}, {}, []
+    for custom_id, batch in meta["batches"].items():
+        batch = [tuple(summary) for summary in batch]
+        entry = responses.get(custom_id)
+        if entry is None or not entry.get("response"):
+            reason = ((entry or {}).get("error") or {}).get("message", "no result for this job")
+            errors.update({key: reason for key, _, _ in batch})
+            retry_batches.append(batch)
+            continue
+        content = entry["response"]["body"]["choices"][0]["message"]["content"]
+        batch_results, unanswered = match_answers(batch, content)
+        results.update(batch_results)
+        if unanswered:
+            errors.update({key: "no valid screening record in the answer" for key, _, _ in unanswered})
+            retry_batches.extend(split_unanswered(batch, unanswered) if len(batch) > 1 else [batch])
+    if retry_jobs_path and retry_batches:
+        write_jobs(retry_batches, meta["criteria"], retry_jobs_path, meta["model"])
+    return results, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a screening job file (written by batch_screen.py "
+                                                 "--job-file) against an OpenAI-compatible endpoint.")
+    parser.add_argument("jobs", help="Job file (JSONL)")
+    parser.add_argument("results", help="Results file to append to (JSONL)")
+    parser.add_argument("--api-base", help="Endpoint to send the jobs to, e.g. http://localhost:8808/v1")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args(argv)
+    sent = replay_jobs(args.jobs, args.results, api_base=args.api_base, concurrency=args.concurrency)
+    print(f"Sent {sent} jobs; results in {args.results}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import re
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Speaks just enough of the OpenAI (/v1/chat/completions) and Ollama (/api/*) HTTP APIs for
+# the screening, streaming and model-manager code paths. Point OPENAI_API_BASE at
+# http://host:port/v1 and OLLAMA_HOST at http://host:port to use it.
+
+
+def _answer(messages):
+    prompt = " ".join(message.get("content", "") for message in messages)
+    if "Return a JSON array" in prompt:
+        return _batch_answer(prompt)
+    decision = "Include" if zlib.crc32(prompt.encode("utf-8")) % 2 else "Exclude"
+    return (f"Title: Synthetic paper\nAbstract: A synthetic abstract.\n"
+            f"Decision: {decision}\nConfidence: 90\nReason: Deterministic mock answer.")
+
+
+# Batched screening prompts list papers as "Paper <n>"; answer each with a JSON record
+def _batch_answer(prompt):
+    records = []
+    for number, block in re.findall(r"^Paper (\d+)\n(.*?)(?=^Paper \d+\n|\Z)", prompt, re.MULTILINE | re.DOTALL):
+        decision = "Include" if zlib.crc32(block.encode("utf-8")) % 2 else "Exclude"
+        records.append({"id": int(number), "title": "Synthetic paper", "decision": decision,
+                        "reason": "Deterministic mock answer."})
+    return json.dumps(records)
+
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0       # Seconds before the first byte of every response
+    token_delay = 0.0   # Seconds between streamed chunks
+    requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Chunked transfer so clients see each piece as it is written
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+        if self.token_delay:
+            time.sleep(self.token_delay)
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama3:latest", "model": "llama3:latest"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        body = self._body()
+        with self._lock:
+            MockLLMHandler.requests += 1
+        time.sleep(self.latency)
+        if self.path.endswith("/chat/completions"):
+            self._openai_chat(body)
+        elif self.path == "/api/chat":
+            self._ollama_chat(body)
+        elif self.path == "/api/generate":
+            self._send_json({"model": body.get("model"), "response": "", "done": True})
+        elif self.path == "/api/pull":
+            self._send_json({"status": "success"})
+        else:
+            self.send_error(404)
+
+    def _openai_chat(self, body):
+        answer = _answer(body.get("messages", []))
+        if not body.get("stream"):
+            prompt_tokens = _tokens(json.dumps(body.get("messages", [])))
+            self._send_json({
+                "id": "mock", "object": "chat.completion", "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": _tokens(answer),
+                          "total_tokens": prompt_tokens + _tokens(answer)},
+            })
+            return
+        self._start_stream("text/event-stream")
+        for word in answer.split(" "):
+            chunk = {"id": "mock", "object": "chat.completion.chunk", "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+    def _ollama_chat(self, body):
+        answer = _answer(body.get("messages", []))
+        final = {"model": body.get("model"), "done": True,
+                 "prompt_eval_count": _tokens(json.dumps(body.get("messages", []))), "eval_count": _tokens(answer)}
+        if body.get("stream") is False:
+            self._send_json({**final, "message": {"role": "assistant", "content": answer}})
+            return
+        self._start_stream("application/x-ndjson")
+        for word in answer.split(" "):
+            chunk = {"model": body.get("model"), "done": False,
+                     "message": {"role": "assistant", "content": word + " "}}
+            self._send_chunk((json.dumps(chunk) + "\n").encode("utf-8"))
+        self._send_chunk((json.dumps({**final, "message": {"role": "assistant", "content": ""}}) + "\n").encode())
+        self._end_stream()
+
+
+# Start a mock server on a background thread; returns (server, base_url)
+def start_mock_server(port=0, latency=0.0, token_delay=0.0):
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {"latency": latency, "token_delay": token_delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Ollama server for benchmarks.")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+    server, url = start_mock_server(args.port, args.latency, args.token_delay)
+    print(f"Mock LLM server on {url} (OPENAI_API_BASE={url}/v1, OLLAMA_HOST={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import hashlib
+import platform
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+# Shared helpers live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bibliographic import paper_records
+from chunking import query_papers
+from collection_ops import find_duplicate_papers, find_excluded_papers
+from extraction_cache import EXTRACTORS, ExtractionCache
+from near_duplicates import MinHasher, NearDuplicateIndex, jaccard_estimate, DEFAULT_THRESHOLD
+from pdf_ingestion import ingest_pdfs, list_pdfs, DEFAULT_WORKERS
+from synthetic_corpus import generate_corpus, paper_text, EXCLUSION_WORDS, TOPIC_WORDS
+from mock_llm_server import start_mock_server
+
+QUERIES = ["music therapy for older adults with dementia", "reminiscence and autobiographical memory",
+           "loneliness in nursing home residents", "singing groups and depression scores"]
+MIN_NEAR_DUPLICATE_RECALL = 0.95  # Share of pairs at or just above the threshold the LSH index must find
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words vectors: isolates Chroma and pipeline timings from model speed."""
+
+    def __init__(self, dimensions=384):
+        self.dimensions = dimensions
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []
+
+    # Time a block and record it as one stage for one corpus size
+    @contextmanager
+    def stage(self, size, name, items):
+        start = time.perf_counter()
+        extra = {}
+        yield extra
+        seconds = time.perf_counter() - start
+        self.results.append({"size": size, "stage": name, "items": items, "seconds": round(seconds, 4),
+                             "ms_per_item": round(1000 * seconds / items, 3) if items else None, **extra})
+        print(f"  {name:<24} {seconds:9.3f}s  ({items} items)")
+
+
+def bench_size(recorder, size, workdir, embedder, args):
+    corpus = os.path.join(workdir, f"corpus_{size}")
+    manifest = None
+    if not os.path.isdir(corpus):
+        manifest = generate_corpus(corpus, size, words=args.words)
+    pdf_paths = list_pdfs(corpus)
+    print(f"{size} papers")
+
+    # Raw extractor speed, no cache
+    texts = {}
+    for name, (_, extract) in EXTRACTORS.items():
+        with recorder.stage(size, f"extract_{name}", len(pdf_paths)):
+            for path in pdf_paths:
+                with open(path, "rb") as f:
+                    texts[os.path.basename(path)] = extract(f.read())
+
+    records = []
+    with recorder.stage(size, "chunk", len(texts)) as extra:
+        for paper_id, text in texts.items():
+            records.append(paper_records(paper_id, text, {"filename": paper_id}))
+        extra["chunks"] = sum(len(ids) for ids, _, _ in records)
+    documents = [doc for _, docs, _ in records for doc in docs]
+
+    with recorder.stage(size, "embed", len(documents)):
+        embeddings = embedder.embed_documents(documents)
+
+    import chromadb
+    client = chromadb.PersistentClient(path=os.path.join(workdir, f"chroma_{size}"))
+    collection = client.get_or_create_collection("benchmark")
+    ids = [record_id for record_ids, _, _ in records for record_id in record_ids]
+    metadatas = [meta for _, _, metas in records for meta in metas]
+    batch = client.get_max_batch_size()
+    with recorder.stage(size, "collection_add", len(ids)):
+        for start in range(0, len(ids), batch):
+            collection.add(ids=ids[start:start + batch], documents=documents[start:start + batch],
+                           metadatas=metadatas[start:start + batch], embeddings=embeddings[start:start + batch])
+
+    with recorder.stage(size, "query", args.queries):
+        for index in range(args.queries):
+            query_papers(collection, embedder.embed_query(QUERIES[index % len(QUERIES)]), top_k=10)
+
+    with recorder.stage(size, "dedupe_exact", size) as extra:
+        extra["found"] = len(find_duplicate_papers(collection, threshold=1.0)[0])
+    with recorder.stage(size, "dedupe_near", size) as extra:
+        duplicate_ids, clusters = find_duplicate_papers(collection)
+        extra["found"] = len(duplicate_ids)
+        if manifest and manifest["duplicates"]:
+            # Known copies that ended up in the same cluster as their original
+            cluster_of = {paper: index for index, cluster in enumerate(clusters)
+                          for paper in [cluster["canonical"], *cluster["duplicates"]]}
+            found = sum(copy in cluster_of and cluster_of[copy] == cluster_of.get(original)
+                        for copy, original in manifest["duplicates"].items())
+            extra["recall"] = round(found / len(manifest["duplicates"]), 3)
+    with recorder.stage(size, "exclusion", size) as extra:
+        extra["found"] = len(find_excluded_papers(collection, EXCLUSION_WORDS)[0])
+
+    # The whole ingestion pipeline from a cold extraction cache into an empty collection
+    cache_dir = os.path.join(workdir, f"cache_{size}")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    pipeline_collection = client.get_or_create_collection("benchmark_pipeline")
+    with recorder.stage(size, "ingest_pipeline", len(pdf_paths)):
+        ingest_pdfs(pdf_paths, pipeline_collection, workers=args.workers, cache=ExtractionCache(cache_dir),
+                    embed_fn=embedder.embed_documents)
+
+    if not args.skip_llm:
+        bench_llm(recorder, size, list(texts.items())[:args.llm_papers], args)
+
+
+def bench_llm(recorder, size, papers, args):
+    import openai
+    from screening import screen_papers, RateLimiter
+    from batched_screening import screen_papers_batched
+    from llm_streaming import stream_openai, render_stream
+
+    server, url = start_mock_server(latency=args.llm_latency, token_delay=args.token_delay)
+    openai.api_base, openai.api_key = f"{url}/v1", "benchmark"
+    try:
+        criteria = " ".join(TOPIC_WORDS[:12])
+        with recorder.stage(size, "llm_screening", len(papers)) as extra:
+            results = list(screen_papers(papers, criteria, concurrency=args.concurrency,
+                                         limiter=RateLimiter(100000, 10 ** 9), bypass_cache=True))
+            extra["errors"] = sum(error is not None for _, _, error in results)
+        with recorder.stage(size, "llm_screening_cascade", len(papers)) as extra:
+            results = list(screen_papers(papers, criteria, concurrency=args.concurrency,
+                                         limiter=RateLimiter(100000, 10 ** 9), bypass_cache=True, cascade={}))
+            extra["errors"] = sum(error is not None for _, _, error in results)
+            extra["full_text"] = sum(result[4] == "full_text" for _, result, error in results if error is None)
+        with recorder.stage(size, "llm_screening_batched", len(papers)) as extra:
+            results = list(screen_papers_batched(papers, criteria, concurrency=args.concurrency,
+                                                 limiter=RateLimiter(100000, 10 ** 9), bypass_cache=True))
+            extra["errors"] = sum(error is not None for _, _, error in results)
+
+        class _Sink:
+            def markdown(self, text):
+                pass
+
+        first_tokens = []
+        with recorder.stage(size, "llm_streaming", args.queries) as extra:
+            for index in range(args.queries):
+                messages = [{"role": "user", "content": QUERIES[index % len(QUERIES)]}]
+                first_tokens.append(render_stream(stream_openai("gpt-4o-mini", messages), _Sink())[1]["ttft"])
+            extra["ttft_p50"] = round(float(np.percentile(first_tokens, 50)), 4)
+    finally:
+        server.shutdown()
+
+
+# Share of text pairs whose MinHash estimate is at or just above the threshold that the LSH index finds
+def near_duplicate_recall(threshold=DEFAULT_THRESHOLD, pairs=200, seed=7):
+    rng = random.Random(seed)
+    hasher = MinHasher()
+    found = tested = 0
+    while tested < pairs:
+        words = paper_text(rng, words=400).split()
+        copy = list(words)
+        for _ in range(rng.randint(1, 12)):
+            copy[rng.randrange(len(copy))] = rng.choice(TOPIC_WORDS)
+        signature_a, signature_b = hasher.signature(" ".join(words)), hasher.signature(" ".join(copy))
+        if not threshold <= jaccard_estimate(signature_a, signature_b) < threshold + 0.05:
+            continue
+        index = NearDuplicateIndex(threshold, hasher=hasher)
+        index.add("original", signature=signature_a)
+        found += bool(index.query(signature=signature_b))
+        tested += 1
+    return found / pairs
+
+
+# Stages whose time per item grew by more than `tolerance` against a baseline results file
+def regressions(results, baseline, tolerance):
+    previous = {(r["size"], r["stage"]): r for r in baseline["results"]}
+    slower = []
+    for result in results:
+        before = previous.get((result["size"], result["stage"]))
+        if before and before["seconds"] and result["seconds"] > before["seconds"] * (1 + tolerance):
+            slower.append({"size": result["size"], "stage": result["stage"],
+                           "baseline": before["seconds"], "seconds": result["seconds"]})
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction, embedding, Chroma, dedupe, "
+                                                 "exclusion and LLM screening on synthetic corpora.")
+    parser.add_argument("--sizes", default="100", help="Comma-separated corpus sizes, e.g. 100,1000,10000")
+    parser.add_argument("--words", type=int, default=3000, help="Words per synthetic paper")
+    parser.add_argument("--workdir", help="Where corpora and databases go (default: a temporary folder)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--embedder", choices=["model", "hashing"], default="model",
+                        help="'model' uses the real embedding service; 'hashing' skips model cost")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--llm-papers", type=int, default=50, help="Papers screened against the mock server")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock server seconds per request")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Mock server seconds per streamed chunk")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    if args.embedder == "model":
+        from embedding_service import get_embedding_service
+        embedder = get_embedding_service()
+    else:
+        embedder = HashingEmbedder()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="srbench_")
+    recorder = Recorder()
+    for size in (int(size) for size in args.sizes.split(",")):
+        bench_size(recorder, size, workdir, embedder, args)
+    recall = near_duplicate_recall()
+    print(f"Near-duplicate recall just above the threshold: {recall:.1%}")
+
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "embedder": args.embedder,
+                 "words_per_paper": args.words, "llm_latency": args.llm_latency},
+        "results": recorder.results,
+        "near_duplicate_recall": recall,
+    }
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = regressions(recorder.results, json.load(f), args.tolerance)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.output}")
+    if report.get("regressions"):
+        for slower in report["regressions"]:
+            print(f"REGRESSION {slower['stage']} @ {slower['size']}: {slower['baseline']}s -> {slower['seconds']}s")
+        return 1
+    if recall < MIN_NEAR_DUPLICATE_RECALL:
+        print(f"RECALL near-duplicate pairs just above the threshold: {recall:.1%} < {MIN_NEAR_DUPLICATE_RECALL:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import random
+import argparse
+
+# Source databases, used as filename prefixes the way the real corpus is named
+DATABASES = ["PubMed", "Scopus", "PsycINFO", "CINAHL"]
+SECTIONS = ["Abstract", "Introduction", "Methods", "Results", "Discussion", "Conclusion", "References"]
+TOPIC_WORDS = (
+    "music therapy reminiscence elderly older adults dementia wellbeing quality life depression "
+    "anxiety cognition memory nursing home care residents intervention group session singing "
+    "listening playlist autobiographical recall mood loneliness social engagement caregivers"
+).split()
+FILLER_WORDS = (
+    "the of and in to a was were with for on by as at from this that study participants data "
+    "analysis results showed significant effect compared between after before during measured "
+    "scores outcome randomized controlled trial baseline follow weeks months sample size mean"
+).split()
+EXCLUSION_WORDS = ["HIV", "cancer", "chemotherapy", "adolescents", "children", "stroke"]
+LINES_PER_PAGE = 60
+WORDS_PER_LINE = 14
+
+
+def _sentence(rng, exclusion_rate):
+    words = [rng.choice(TOPIC_WORDS if rng.random() < 0.3 else FILLER_WORDS) for _ in range(rng.randint(8, 20))]
+    if rng.random() < exclusion_rate:
+        words[rng.randrange(len(words))] = rng.choice(EXCLUSION_WORDS)
+    return " ".join(words).capitalize() + "."
+
+
+# Text of one synthetic paper: a title, then section headings each on their own line
+def paper_text(rng, words=3000, exclusion_rate=0.0):
+    lines = [" ".join(rng.choice(TOPIC_WORDS) for _ in range(8)).title()]
+    per_section = max(1, words // len(SECTIONS))
+    for section in SECTIONS:
+        lines.append(section)
+        body, count = [], 0
+        while count < per_section:
+            sentence = _sentence(rng, exclusion_rate)
+            body.append(sentence)
+            count += len(sentence.split())
+        text = " ".join(body).split()
+        lines += [" ".join(text[i:i + WORDS_PER_LINE]) for i in range(0, len(text), WORDS_PER_LINE)]
+    return "\n".join(lines)
+
+
+def _escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Minimal multi-page PDF with one Helvetica text line per input line (no PDF library needed)
+def write_pdf(path, text):
+    lines = text.split("\n")
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for index, page in enumerate(pages):
+        page_id, content_id = 4 + 2 * index, 5 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        stream = "BT /F1 9 Tf 11 TL 40 760 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in page) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[object_id] for object_id in sorted(objects))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+# Write `size` PDFs to folder; some are exact or near copies of earlier ones, some mention exclusion terms
+def generate_corpus(folder, size, words=3000, duplicate_rate=0.05, near_duplicate_rate=0.05,
+                    exclusion_rate=0.1, seed=42):
+    """Returns {"papers": [filenames], "duplicates": {copy: original}, "excluded": [filenames]}."""
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    manifest = {"papers": [], "duplicates": {}, "excluded": []}
+    texts = []
+    for index in range(size):
+        filename = f"{DATABASES[index % len(DATABASES)]}_{index:05d}.pdf"
+        roll = rng.random()
+        if texts and roll < duplicate_rate:
+            original, text = rng.choice(texts)
+            manifest["duplicates"][filename] = original
+        elif texts and roll < duplicate_rate + near_duplicate_rate:
+            original, text = rng.choice(texts)
+            lines = text.split("\n")
+            lines[-1] = paper_text(rng, words=30).split("\n")[-1]  # Same paper, slightly different ending
+            text = "\n".join(lines)
+            manifest["duplicates"][filename] = original
+        else:
+            excluded = rng.random() < exclusion_rate
+            text = paper_text(rng, words, exclusion_rate=0.02 if excluded else 0.0)
+            if excluded:
+                manifest["excluded"].append(filename)
+            texts.append((filename, text))
+        write_pdf(os.path.join(folder, filename), text)
+        manifest["papers"].append(filename)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of research-paper PDFs.")
+    parser.add_argument("folder")
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--words", type=int, default=3000, help="Words per paper")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    result = generate_corpus(args.folder, args.size, words=args.words, seed=args.seed)
+    print(f"Wrote {len(result['papers'])} PDFs to {args.folder} "
+          f"({len(result['duplicates'])} duplicates, {len(result['excluded'])} with exclusion terms)")
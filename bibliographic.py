@@ -0,0 +1,114 @@
+import re
+import time
+from collections import Counter
+
+from chunking import chunk_records, split_sections
+from extraction_cache import PAGE_BREAK
+
+# Filename prefixes added when exporting from each database (e.g. "PubMed_" in MovePDFsZotero.py)
+DATABASES = ["PubMed", "Scopus", "PsycINFO", "CINAHL", "Embase", "WebOfScience", "Cochrane"]
+UNKNOWN_DATABASE = "unknown"
+ABSTRACT_MAX_WORDS = 400
+TITLE_MAX_CHARS = 300
+
+_DOI_RE = re.compile(r"\b10\.\d{4,9}/[-._;()/:a-z0-9]+", re.IGNORECASE)
+_YEAR_RE = re.compile(r"\b(19[5-9]\d|20\d\d)\b")
+_PUBLISHED_RE = re.compile(r"(?:©|\(c\)|copyright|published|accepted|received)[^\n]{0,30}?\b(19[5-9]\d|20\d\d)\b",
+                           re.IGNORECASE)
+# Lines on a first page that are running heads or publisher boilerplate, never the title
+_NOT_TITLE_RE = re.compile(r"doi|https?:|www\.|@|©|copyright|journal|vol\.|volume|issn|received|accepted|"
+                           r"published|downloaded|licen[cs]e|open access|original (?:article|research)",
+                           re.IGNORECASE)
+
+
+def _first_page(text):
+    return text.split(PAGE_BREAK, 1)[0]
+
+
+def page_count(text):
+    return text.count("\f") + 1 if text.strip() else 0
+
+
+# Source database from the export prefix of a filename ("PubMed_smith2020.pdf" -> "PubMed")
+def source_database(filename):
+    prefix = filename.split("_", 1)[0].lower() if "_" in filename else ""
+    return next((name for name in DATABASES if name.lower() == prefix), UNKNOWN_DATABASE)
+
+
+# The paper's own DOI: the first one on the first page (later pages are mostly cited works)
+def find_doi(text):
+    match = _DOI_RE.search(_first_page(text))
+    return match.group(0).rstrip(".,;:)").lower() if match else None
+
+
+# Publication year: one next to "Published"/"©"/"Accepted" on the first page, else the most frequent there
+def find_year(text):
+    first_page = _first_page(text)
+    latest = time.localtime().tm_year + 1
+    published = [int(year) for year in _PUBLISHED_RE.findall(first_page) if int(year) <= latest]
+    if published:
+        return max(published)
+    years = [int(year) for year in _YEAR_RE.findall(first_page) if int(year) <= latest]
+    return Counter(years).most_common(1)[0][0] if years else None
+
+
+# First line on the first page that reads like a title, joined with its continuation line
+def find_title(text):
+    lines = [line.strip() for line in _first_page(text).splitlines()]
+    for index, line in enumerate(lines):
+        words = line.split()
+        if len(words) < 3 or _NOT_TITLE_RE.search(line) or sum(c.isdigit() for c in line) > len(line) / 4:
+            continue
+        title = line
+        following = lines[index + 1] if index + 1 < len(lines) else ""
+        if following and following[0].islower() and not title.endswith("."):
+            title = f"{title} {following}"
+        return title[:TITLE_MAX_CHARS]
+    return None
+
+
+def find_abstract(text):
+    for label, body in split_sections(text):
+        if label == "abstract":
+            return " ".join(body.split()[:ABSTRACT_MAX_WORDS])
+    return None
+
+
+def extract_bibliographic(text, filename):
+    """
+    Title, abstract, year, DOI, source database and page count read from the extracted
+    text and filename. Fields that cannot be found are left out (Chroma metadata cannot be None).
+    """
+    fields = {
+        "title": find_title(text),
+        "abstract": find_abstract(text),
+        "year": find_year(text),
+        "doi": find_doi(text),
+        "source_database": source_database(filename),
+        "pages": page_count(text),
+    }
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+# chunk_records() with bibliographic metadata on every chunk; the abstract goes on the first chunk only
+def paper_records(paper_id, text, metadata=None, **chunk_kwargs):
+    fields = extract_bibliographic(text, paper_id)
+    abstract = fields.pop("abstract", None)
+    ids, documents, metadatas = chunk_records(paper_id, text, {**(metadata or {}), **fields}, **chunk_kwargs)
+    if abstract and metadatas:
+        metadatas[0]["abstract"] = abstract
+    return ids, documents, metadatas
+
+
+# Chroma `where` filter on source database and publication year; None when nothing is restricted
+def metadata_filter(databases=None, year_from=None, year_to=None):
+    conditions = []
+    if databases:
+        conditions.append({"source_database": {"$in": list(databases)}})
+    if year_from:
+        conditions.append({"year": {"$gte": int(year_from)}})
+    if year_to:
+        conditions.append({"year": {"$lte": int(year_to)}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
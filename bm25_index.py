@@ -0,0 +1,163 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+from keyword_matcher import stem
+
+# Where index files go; unset = next to the collection's own Chroma store
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR") or None
+DEFAULT_INDEX_DIR = "chroma_db"  # For collections given by name or held in memory
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have in into is it its of on or that the their "
+    "there these this to was were which with".split()
+)
+
+
+# Stemmed unigrams plus adjacent-word bigrams, so phrases like "reminiscence therapy" score as a unit
+def terms(text):
+    words = [stem(word) for word in _TOKEN_RE.findall((text or "").lower()) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class BM25Index:
+    """
+    SQLite inverted index over collection chunks (term -> chunk -> term frequency).
+    Adding or deleting a paper only touches that paper's rows, so it is kept in step with
+    Chroma at ingest and delete time instead of being rebuilt.
+    """
+
+    def __init__(self, path, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, paper_id TEXT, length INTEGER);"
+            "CREATE INDEX IF NOT EXISTS chunks_paper ON chunks(paper_id);"
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT, chunk_id TEXT, tf INTEGER,"
+            " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id);"
+            "CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER);"
+            "INSERT OR IGNORE INTO stats VALUES ('chunks', 0), ('length', 0);"
+        )
+        self._conn.commit()
+
+    def _stat(self, key):
+        return self._conn.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()[0]
+
+    def _remove_chunks(self, chunk_ids):
+        removed, removed_length = 0, 0
+        for chunk_id in chunk_ids:
+            row = self._conn.execute("SELECT length FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+            removed += 1
+            removed_length += row[0]
+        self._conn.execute("UPDATE stats SET value = value - ? WHERE key = 'chunks'", (removed,))
+        self._conn.execute("UPDATE stats SET value = value - ? WHERE key = 'length'", (removed_length,))
+
+    # Index chunks the way they were written to Chroma; existing chunk ids are replaced
+    def add(self, ids, documents, metadatas=None):
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            self._remove_chunks(ids)
+            total_length = 0
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                counts = Counter(terms(document))
+                length = sum(counts.values())
+                total_length += length
+                self._conn.execute("INSERT INTO chunks VALUES (?, ?, ?)",
+                                   (chunk_id, (metadata or {}).get("paper_id", chunk_id), length))
+                self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                       [(term, chunk_id, tf) for term, tf in counts.items()])
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'chunks'", (len(ids),))
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'length'", (total_length,))
+            self._conn.commit()
+
+    # Remove every chunk of the given papers (and legacy whole-paper records with those ids)
+    def delete_papers(self, paper_ids):
+        paper_ids = list(paper_ids)
+        if not paper_ids:
+            return
+        with self._lock:
+            chunk_ids = set(paper_ids)
+            for start in range(0, len(paper_ids), 500):
+                batch = paper_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE paper_id IN ({','.join('?' * len(batch))})", batch
+                )
+                chunk_ids.update(row[0] for row in rows)
+            self._remove_chunks(chunk_ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript(
+                "DELETE FROM postings; DELETE FROM chunks; UPDATE stats SET value = 0;"
+            )
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._stat("chunks")
+
+    # Top chunks for a query as [(chunk_id, score)], best first
+    def search(self, query, top_k=50):
+        query_terms = set(terms(query))
+        with self._lock:
+            total = self._stat("chunks")
+            if not total or not query_terms:
+                return []
+            average_length = self._stat("length") / total
+            scores = {}
+            for term in query_terms:
+                postings = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                    "WHERE p.term = ?", (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+# Persist directory of a Chroma collection, or None for in-memory collections and plain names
+def chroma_directory(collection):
+    try:
+        settings = collection._client.get_settings()
+    except AttributeError:
+        return None
+    return settings.persist_directory if settings.is_persistent else None
+
+
+# The BM25 index that shadows a Chroma collection (or collection name), one SQLite file per name
+def index_for(collection, directory=BM25_INDEX_DIR):
+    """
+    The index lives in the collection's persist directory, so two Chroma stores with the same
+    collection name never share one. Pass directory for a collection given by name.
+    """
+    name = getattr(collection, "name", collection)
+    directory = directory or chroma_directory(collection) or DEFAULT_INDEX_DIR
+    path = os.path.join(directory, f"{name}_bm25.sqlite")
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = BM25Index(path)
+        return _indexes[path]
@@ -0,0 +1,116 @@
+import re
+
+from metrics import timed
+from bm25_index import index_for
+
+DEFAULT_CHUNK_WORDS = 180   # all-MiniLM-L6-v2 truncates at 256 word pieces
+DEFAULT_OVERLAP_WORDS = 40
+DEFAULT_OVERSAMPLE = 5      # Chunks fetched per requested paper before aggregating
+
+# Headings that start a new section, matched on their own line (optionally numbered)
+SECTION_PATTERNS = [
+    ("abstract", r"abstract|summary"),
+    ("introduction", r"introduction|background"),
+    ("methods", r"methods?|methodology|materials and methods|study design|participants"),
+    ("results", r"results|findings"),
+    ("discussion", r"discussion"),
+    ("conclusion", r"conclusions?|concluding remarks"),
+    ("references", r"references|bibliography|works cited"),
+]
+_HEADING_RE = re.compile(
+    r"^[ \t]*(?:\d+(?:\.\d+)*\.?[ \t]+)?(?P<heading>"
+    + "|".join(f"(?P<{label}>{pattern})" for label, pattern in SECTION_PATTERNS)
+    + r")[ \t]*[:.]?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+# Split text into (section label, section text) pairs using detected headings
+def split_sections(text):
+    sections = []
+    label, start = "front_matter", 0
+    for match in _HEADING_RE.finditer(text):
+        sections.append((label, text[start:match.start()]))
+        label = next(name for name, _ in SECTION_PATTERNS if match.group(name))
+        start = match.end()
+    sections.append((label, text[start:]))
+    return [(label, body) for label, body in sections if body.strip()]
+
+
+# Split a paper into overlapping word windows that never cross a section boundary
+def chunk_text(text, chunk_words=DEFAULT_CHUNK_WORDS, overlap_words=DEFAULT_OVERLAP_WORDS):
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for section, body in split_sections(text):
+        words = body.split()
+        previous_end = 0
+        for start in range(0, len(words), step):
+            window = words[start:start + chunk_words]
+            # "overlap" counts the leading words repeated from the previous chunk of this section
+            chunks.append({"text": " ".join(window), "section": section, "index": len(chunks),
+                           "overlap": max(0, previous_end - start)})
+            previous_end = start + len(window)
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+
+def chunk_id(paper_id, index):
+    return f"{paper_id}#chunk-{index:04d}"
+
+
+# Build ids, documents and metadatas for every chunk of one paper
+def chunk_records(paper_id, text, metadata=None, chunk_words=DEFAULT_CHUNK_WORDS,
+                  overlap_words=DEFAULT_OVERLAP_WORDS):
+    ids, documents, metadatas = [], [], []
+    for chunk in chunk_text(text, chunk_words, overlap_words):
+        ids.append(chunk_id(paper_id, chunk["index"]))
+        documents.append(chunk["text"])
+        metadatas.append({**(metadata or {}), "paper_id": paper_id, "section": chunk["section"],
+                          "chunk": chunk["index"], "overlap": chunk["overlap"]})
+    return ids, documents, metadatas
+
+
+# Paper a stored record belongs to (records stored before chunking are whole papers)
+def paper_of(record_id, metadata):
+    return (metadata or {}).get("paper_id", record_id)
+
+
+# Delete every chunk of the given papers (and any legacy whole-paper records)
+def delete_papers(collection, paper_ids):
+    paper_ids = list(paper_ids)
+    if not paper_ids:
+        return
+    collection.delete(where={"paper_id": {"$in": paper_ids}})
+    collection.delete(ids=paper_ids)
+    index_for(collection).delete_papers(paper_ids)
+
+
+# Rank papers by their best-matching chunk from a collection.query result
+def aggregate_by_paper(results, top_k=10, chunks_per_paper=3):
+    papers = {}
+    distances = (results.get("distances") or [[0.0] * len(results["ids"][0])])[0]
+    for record_id, doc, meta, distance in zip(results["ids"][0], results["documents"][0],
+                                              results["metadatas"][0], distances):
+        paper = papers.setdefault(paper_of(record_id, meta),
+                                  {"paper_id": paper_of(record_id, meta), "distance": distance, "chunks": []})
+        paper["distance"] = min(paper["distance"], distance)
+        if len(paper["chunks"]) < chunks_per_paper:
+            paper["chunks"].append({"id": record_id, "text": doc,
+                                    "section": (meta or {}).get("section", "full_text"),
+                                    "chunk": (meta or {}).get("chunk", 0),
+                                    "overlap": (meta or {}).get("overlap", 0),
+                                    "distance": distance})
+    # Papers hit by several chunks win ties over papers hit once
+    ranked = sorted(papers.values(), key=lambda p: (p["distance"], -len(p["chunks"])))
+    return ranked[:top_k]
+
+
+# Query chunk vectors and return the top_k papers with their best chunks
+@timed("retrieve")
+def query_papers(collection, query_embedding, top_k=10, chunks_per_paper=3, oversample=DEFAULT_OVERSAMPLE,
+                 where=None):
+    n_results = max(1, min(top_k * oversample, collection.count()))
+    results = collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where)
+    return aggregate_by_paper(results, top_k, chunks_per_paper)
+
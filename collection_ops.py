@@ -0,0 +1,137 @@
+import hashlib
+
+from chunking import delete_papers, paper_of
+from keyword_matcher import KeywordMatcher
+from near_duplicates import MinHasher, cluster_signatures, DEFAULT_THRESHOLD
+from metrics import timed
+
+DELETE_BATCH_SIZE = 500
+SCAN_PAGE_SIZE = 500
+
+
+# Page through a collection with limit/offset, fetching only the fields in `include`
+def scan(collection, include=("metadatas",), page_size=SCAN_PAGE_SIZE, where=None, where_document=None):
+    """
+    Yields collection.get() pages of at most page_size records, so corpus-wide passes run in
+    constant memory. Use include=() to read IDs only. Collect IDs first and delete afterwards:
+    deleting while paging shifts the offsets.
+    """
+    offset = 0
+    while True:
+        page = collection.get(include=list(include), limit=page_size, offset=offset,
+                              where=where, where_document=where_document)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+        if len(page["ids"]) < page_size:
+            return
+
+
+# Yield (record_id, document, metadata) for every record, one page at a time
+def iter_records(collection, include=("documents", "metadatas"), **scan_kwargs):
+    for page in scan(collection, include, **scan_kwargs):
+        documents = page.get("documents") or [None] * len(page["ids"])
+        metadatas = page.get("metadatas") or [None] * len(page["ids"])
+        yield from zip(page["ids"], documents, metadatas)
+
+
+# Distinct paper IDs in a collection, read from metadata only (no document text)
+def list_paper_ids(collection, **scan_kwargs):
+    paper_ids = {}
+    for record_id, _, meta in iter_records(collection, include=("metadatas",), **scan_kwargs):
+        paper_ids.setdefault(paper_of(record_id, meta))
+    return list(paper_ids)
+
+
+def count_papers(collection):
+    return len(list_paper_ids(collection))
+
+
+# Delete every chunk of the given papers in batches; with dry_run nothing is deleted
+@timed("chroma_delete")
+def remove_papers(collection, paper_ids, batch_size=DELETE_BATCH_SIZE, dry_run=False):
+    paper_ids = list(paper_ids)
+    if not dry_run:
+        for start in range(0, len(paper_ids), batch_size):
+            delete_papers(collection, paper_ids[start:start + batch_size])
+    return paper_ids
+
+
+# Chunk text without the leading words repeated from the previous chunk
+def _new_words(doc, meta):
+    overlap = (meta or {}).get("overlap", 0)
+    return " ".join(doc.split(" ")[overlap:]) if overlap else doc
+
+
+# Duplicate papers and their clusters; a threshold of 1.0 only removes identical text
+@timed("dedupe")
+def find_duplicate_papers(collection, threshold=DEFAULT_THRESHOLD, page_size=SCAN_PAGE_SIZE):
+    """
+    Streams the chunks once, keeping only a digest (exact mode) or a merged MinHash
+    signature (near-duplicate mode) per paper, never the paper text itself.
+    """
+    exact = threshold >= 1.0
+    hasher = None if exact else MinHasher()
+    chunk_digests, signatures, lengths = {}, {}, {}
+
+    for record_id, doc, meta in iter_records(collection, page_size=page_size):
+        paper_id = paper_of(record_id, meta)
+        doc = doc or ""
+        body = _new_words(doc, meta)
+        lengths[paper_id] = lengths.get(paper_id, 0) + len(body)
+        if exact:
+            digest = hashlib.sha256(body.encode("utf-8")).digest()
+            chunk_digests.setdefault(paper_id, []).append(((meta or {}).get("chunk", 0), digest))
+        else:
+            # The MinHash of a union is the element-wise minimum of the parts
+            signature = hasher.signature(doc)
+            signatures[paper_id] = MinHasher.merge(signatures[paper_id], signature) if paper_id in signatures else signature
+
+    if exact:
+        first_copy, clusters = {}, {}
+        for paper_id, digests in chunk_digests.items():
+            paper_digest = hashlib.sha256(b"".join(digest for _, digest in sorted(digests))).digest()
+            canonical = first_copy.setdefault(paper_digest, paper_id)
+            if canonical != paper_id:
+                cluster = clusters.setdefault(canonical, {"canonical": canonical, "duplicates": [], "similarity": {}})
+                cluster["duplicates"].append(paper_id)
+                cluster["similarity"][paper_id] = 1.0
+        clusters = list(clusters.values())
+    else:
+        # MinHash/LSH catches the same paper extracted slightly differently by each database
+        clusters = cluster_signatures(signatures, lengths, threshold)
+    duplicate_ids = [paper_id for cluster in clusters for paper_id in cluster["duplicates"]]
+    return duplicate_ids, clusters
+
+
+# Flatten duplicate clusters into rows for display or CSV export
+def cluster_rows(clusters):
+    return [{"Canonical": cluster["canonical"], "Duplicate": paper_id,
+             "Similarity": round(cluster["similarity"][paper_id], 3)}
+            for cluster in clusters for paper_id in cluster["duplicates"]]
+
+
+# Papers that are empty or mention any exclusion criterion, plus the per-paper hit matrix
+@timed("exclusion")
+def find_excluded_papers(collection, exclusion_criteria, word_boundaries=True, stemming=True,
+                         page_size=SCAN_PAGE_SIZE, where=None):
+    """
+    Only chunks that pass a server-side where_document prefilter are read back and counted;
+    every other paper is listed from metadata alone. `where` restricts the pass to matching
+    metadata (e.g. bibliographic.metadata_filter(...)).
+    """
+    matcher = KeywordMatcher(exclusion_criteria, word_boundaries=word_boundaries, stemming=stemming)
+    hit_matrix = {paper_id: {} for paper_id in list_paper_ids(collection, where=where, page_size=page_size)}
+    document_filter = matcher.document_filter()
+    if document_filter:
+        for record_id, doc, meta in iter_records(collection, page_size=page_size, where=where,
+                                                 where_document=document_filter):
+            hits = hit_matrix.setdefault(paper_of(record_id, meta), {})
+            for criterion, count in matcher.count_chunk(doc or "", (meta or {}).get("overlap", 0)).items():
+                hits[criterion] = hits.get(criterion, 0) + count
+    # Records with no text at all (only legacy whole-paper records can be empty)
+    empty_ids = set(list_paper_ids(collection, where=where, where_document={"$not_regex": r"\S"},
+                                   page_size=page_size))
+    excluded_ids = [paper_id for paper_id, hits in hit_matrix.items() if hits or paper_id in empty_ids]
+    return excluded_ids, hit_matrix
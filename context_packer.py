@@ -0,0 +1,122 @@
+import os
+import re
+
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+MIN_PASSAGE_TOKENS = 40  # Smaller leftovers are not worth a trimmed passage
+
+_encoders = {}
+
+
+# Tokenizer for the target model: tiktoken when installed, else ~4 characters per token
+def _encoder(model):
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model.split("/")[-1])
+            except KeyError:
+                # Non-OpenAI models (llama3, gemini) get the closest general-purpose encoding
+                _encoders[model] = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoders[model] = None
+    return _encoders[model]
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    encoder = _encoder(model)
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+# Longest prefix of text (cut at a sentence, else word, boundary) that fits in max_tokens
+def trim_to_tokens(text, max_tokens, model="gpt-4o-mini"):
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle]), model) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    trimmed = " ".join(words[:low])
+    sentence_end = max(trimmed.rfind(". "), trimmed.rfind("? "), trimmed.rfind("! "))
+    return trimmed[:sentence_end + 1] if sentence_end > len(trimmed) // 2 else trimmed
+
+
+def _drop_words(text, count):
+    return " ".join(text.split()[count:])
+
+
+def _normalized(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+# Fill a token budget with the best passages of the retrieved papers
+def pack_context(papers, budget_tokens=DEFAULT_CONTEXT_TOKENS, model="gpt-4o-mini"):
+    """
+    papers is query_papers() output (ranked, each with its best chunks). Every paper's best
+    chunk is considered before any paper's second chunk, so the budget goes to breadth first.
+    Words a chunk repeats from an already packed neighbouring chunk are dropped, as are exact
+    repeats of packed text. Returns {"context", "paper_ids", "tokens", "dropped"}.
+    """
+    candidates = [
+        (rank, position, paper, chunk)
+        for position, paper in enumerate(papers)
+        for rank, chunk in enumerate(paper["chunks"])
+    ]
+    candidates.sort(key=lambda c: (c[0], c[3]["distance"], c[1]))
+
+    packed = {}  # paper_id -> {chunk index: passage}
+    seen = set()
+    used = 0
+    for _, _, paper, chunk in candidates:
+        paper_id = paper["paper_id"]
+        passages = packed.get(paper_id, {})
+        text = chunk["text"]
+        trimmed = bool(chunk["overlap"]) and chunk["chunk"] - 1 in passages
+        if trimmed:
+            text = _drop_words(text, chunk["overlap"])
+        key = _normalized(text)
+        if not key or key in seen:
+            continue
+        header = 0 if paper_id in packed else count_tokens(f"Document ID: {paper_id}\n", model) + 1
+        cost = header + count_tokens(f"[{chunk['section']}] {text}\n", model)
+        if used + cost > budget_tokens:
+            remaining = budget_tokens - used - header
+            if remaining < MIN_PASSAGE_TOKENS:
+                continue
+            text = trim_to_tokens(text, remaining - count_tokens(f"[{chunk['section']}] \n", model), model)
+            cost = header + count_tokens(f"[{chunk['section']}] {text}\n", model)
+            if not text or used + cost > budget_tokens:
+                continue
+        seen.add(key)
+        packed.setdefault(paper_id, {})[chunk["chunk"]] = {
+            "section": chunk["section"], "text": text, "overlap": chunk["overlap"], "trimmed": trimmed,
+        }
+        used += cost
+        # The following chunk, if packed first, no longer needs the words it shares with this one
+        following = passages.get(chunk["chunk"] + 1)
+        if following and following.get("overlap") and not following.get("trimmed"):
+            before = count_tokens(following["text"], model)
+            following["text"] = _drop_words(following["text"], following["overlap"])
+            following["trimmed"] = True
+            used -= before - count_tokens(following["text"], model)
+
+    # Papers keep their retrieval rank; passages within a paper go back into reading order
+    blocks, paper_ids = [], []
+    for paper in papers:
+        passages = packed.get(paper["paper_id"])
+        if not passages:
+            continue
+        paper_ids.append(paper["paper_id"])
+        body = "\n".join(f"[{passages[index]['section']}] {passages[index]['text']}" for index in sorted(passages))
+        blocks.append(f"Document ID: {paper['paper_id']}\n{body}")
+    return {
+        "context": "\n\n".join(blocks),
+        "paper_ids": paper_ids,
+        "tokens": used,
+        "dropped": [paper["paper_id"] for paper in papers if paper["paper_id"] not in packed],
+    }
@@ -0,0 +1,65 @@
+import os
+import threading
+
+from metrics import stage_timer
+
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+DEFAULT_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps torch's default
+
+
+class EmbeddingService:
+    """One SentenceTransformer model shared by ingestion and queries so all vectors are comparable."""
+
+    def __init__(self, model_name=DEFAULT_MODEL, batch_size=DEFAULT_BATCH_SIZE, num_threads=DEFAULT_THREADS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        # Loaded on first use so importing a script does not pay the model load
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                if self.num_threads:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    # Embed many documents as large batched matrix operations
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        # Sorting by length keeps similar-sized texts together, so batches carry little padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        model = self.model  # Load outside the timer so the first batch does not count the model load
+        with stage_timer("embed") as fields:
+            fields["texts"] = len(texts)
+            vectors = model.encode(
+                [texts[i] for i in order], batch_size=self.batch_size, convert_to_numpy=True
+            )
+        embeddings = [None] * len(texts)
+        for position, i in enumerate(order):
+            embeddings[i] = vectors[position].tolist()
+        return embeddings
+
+    def embed_query(self, text):
+        model = self.model
+        with stage_timer("embed_query"):
+            return model.encode(text, convert_to_numpy=True).tolist()
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_service():
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = EmbeddingService()
+        return _default_service
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from chunking import aggregate_by_paper
+from context_packer import pack_context, DEFAULT_CONTEXT_TOKENS
+from embedding_service import get_embedding_service
+from ingest_manifest import sync_folder
+from pdf_ingestion import DEFAULT_WORKERS
+from screening import build_screening_messages, parse_screening_response, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_COLLECTION = "evaluation"
+CHUNKS_PER_PAPER = 6
+LABEL_VALUES = {"include": True, "included": True, "yes": True, "1": True, "true": True,
+                "exclude": False, "excluded": False, "no": False, "0": False, "false": False}
+
+
+# Each backend takes messages and returns (answer text, total tokens)
+def _complete_openai(messages):
+    import openai
+    response = call_with_retry(lambda: openai.ChatCompletion.create(model="gpt-4o-mini", messages=messages))
+    return response["choices"][0]["message"]["content"], response["usage"]["total_tokens"]
+
+
+def _complete_gemini(messages):
+    from litellm import completion
+    response = call_with_retry(lambda: completion(model="gemini/gemini-1.5-flash", messages=messages,
+                                                  api_key=os.getenv("GEMINI_API_KEY")))
+    return response["choices"][0]["message"]["content"], response["usage"]["total_tokens"]
+
+
+def _complete_ollama(messages):
+    from ollama_manager import get_model_manager
+    response = get_model_manager().chat(messages)
+    return response["message"]["content"], response.get("prompt_eval_count", 0) + response.get("eval_count", 0)
+
+
+BACKENDS = {
+    "openai": ("gpt-4o-mini", _complete_openai),
+    "gemini": ("gemini/gemini-1.5-flash", _complete_gemini),
+    "ollama": (os.getenv("OLLAMA_MODEL", "llama3"), _complete_ollama),
+}
+
+
+# Labelled papers from a CSV with "filename" and "label" (include/exclude, yes/no or 1/0) columns
+def load_labels(path):
+    import pandas as pd
+    frame = pd.read_csv(path, dtype=str)
+    labels = {}
+    for filename, label in zip(frame["filename"], frame["label"]):
+        value = LABEL_VALUES.get(str(label).strip().lower())
+        if value is None:
+            raise ValueError(f"Unrecognised label {label!r} for {filename}")
+        labels[filename.strip()] = value
+    return labels
+
+
+# The same packed context for every backend: the paper's chunks closest to the criteria
+def build_contexts(collection, paper_ids, criteria, context_tokens=DEFAULT_CONTEXT_TOKENS):
+    query_embedding = get_embedding_service().embed_query(criteria)
+    contexts = {}
+    for paper_id in paper_ids:
+        results = collection.query(query_embeddings=[query_embedding], n_results=CHUNKS_PER_PAPER,
+                                   where={"paper_id": paper_id})
+        papers = aggregate_by_paper(results, top_k=1, chunks_per_paper=CHUNKS_PER_PAPER)
+        if papers:
+            contexts[paper_id] = pack_context(papers, budget_tokens=context_tokens)["context"]
+    return contexts
+
+
+# Ask one backend for a decision on every paper, timing each call
+def run_backend(name, contexts, criteria, concurrency=1):
+    _, complete = BACKENDS[name]
+
+    def screen(item):
+        paper_id, context = item
+        start = time.perf_counter()
+        try:
+            content, tokens = complete(build_screening_messages(context, criteria))
+            decision = parse_screening_response(content)[2]
+        except Exception as e:
+            logger.error(f"{name} failed on {paper_id}: {e}")
+            decision, tokens = "Error", 0
+        return {"paper_id": paper_id, "decision": decision, "tokens": tokens,
+                "latency": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        rows = list(executor.map(screen, contexts.items()))
+    return rows, time.perf_counter() - start
+
+
+SCORING_RULE = ("Papers a backend failed on (decision \"Error\") are left out of accuracy, precision and "
+                "recall and counted in error_rate instead.")
+
+
+# Accuracy, precision/recall for "Include", latency percentiles, tokens and throughput (see SCORING_RULE)
+def score(rows, labels, wall_time):
+    scored = [row for row in rows if row["decision"] != "Error"]
+    predicted = [row["decision"] == "Include" for row in scored]
+    actual = [labels[row["paper_id"]] for row in scored]
+    true_positive = sum(p and a for p, a in zip(predicted, actual))
+    false_positive = sum(p and not a for p, a in zip(predicted, actual))
+    false_negative = sum(a and not p for p, a in zip(predicted, actual))
+    precision = true_positive / (true_positive + false_positive) if true_positive + false_positive else 0.0
+    recall = true_positive / (true_positive + false_negative) if true_positive + false_negative else 0.0
+    latencies = [row["latency"] for row in rows]
+    tokens = sum(row["tokens"] or 0 for row in rows)
+    return {
+        "papers": len(rows),
+        "scored": len(scored),
+        "errors": len(rows) - len(scored),
+        "error_rate": (len(rows) - len(scored)) / len(rows) if rows else 0.0,
+        "accuracy": sum(p == a for p, a in zip(predicted, actual)) / len(scored) if scored else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "latency_p95": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        "tokens": tokens,
+        "tokens_per_paper": tokens / len(rows) if rows else 0.0,
+        "papers_per_second": len(rows) / wall_time if wall_time else 0.0,
+        "wall_time": wall_time,
+    }
+
+
+def evaluate(folder, labels_path, criteria, backends, output, chroma_path="./chroma_db",
+             workers=DEFAULT_WORKERS, concurrency=1, context_tokens=DEFAULT_CONTEXT_TOKENS):
+    """
+    Ingest the folder once into its own collection, build one context per labelled paper,
+    then run every backend at the same time on those identical contexts.
+    Writes {"backends": {name: metrics}, "decisions": [...]} to output as JSON.
+    """
+    import chromadb
+    labels = load_labels(labels_path)
+    collection = chromadb.PersistentClient(path=chroma_path).get_or_create_collection(EVALUATION_COLLECTION)
+    report = sync_folder(folder, collection, os.path.join(chroma_path, f"{EVALUATION_COLLECTION}_manifest.json"),
+                         workers=workers, embed_fn=get_embedding_service().embed_documents)
+    for filename, error in report["errors"].items():
+        logger.error(f"Could not ingest {filename}: {error}")
+
+    contexts = build_contexts(collection, sorted(labels), criteria, context_tokens)
+    missing = sorted(set(labels) - set(contexts))
+    if missing:
+        logger.warning(f"{len(missing)} labelled papers are not in the collection: {', '.join(missing)}")
+    logger.info(f"Evaluating {', '.join(backends)} on {len(contexts)} papers")
+
+    with ThreadPoolExecutor(max_workers=len(backends)) as executor:
+        runs = {name: executor.submit(run_backend, name, contexts, criteria, concurrency) for name in backends}
+        results = {name: future.result() for name, future in runs.items()}
+
+    summary = {"scoring": SCORING_RULE, "backends": {}, "decisions": []}
+    for name, (rows, wall_time) in results.items():
+        summary["backends"][name] = {"model": BACKENDS[name][0], **score(rows, labels, wall_time)}
+        summary["decisions"] += [{"backend": name, "label": labels[row["paper_id"]], **row} for row in rows]
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    return summary
+
+
+def format_summary(summary):
+    lines = [f"{'backend':<8} {'accuracy':>8} {'precision':>9} {'recall':>6} {'p50 s':>6} {'p95 s':>6} "
+             f"{'tokens':>8} {'papers/s':>8} {'errors':>6} {'err %':>6}"]
+    for name, m in summary["backends"].items():
+        lines.append(f"{name:<8} {m['accuracy']:>8.1%} {m['precision']:>9.1%} {m['recall']:>6.1%} "
+                     f"{m['latency_p50']:>6.2f} {m['latency_p95']:>6.2f} {m['tokens']:>8} "
+                     f"{m['papers_per_second']:>8.2f} {m['errors']:>6} {m['error_rate']:>6.1%}")
+    lines.append(summary.get("scoring", SCORING_RULE))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare LLM backends on a labelled set of papers.")
+    parser.add_argument("folder", help="Folder containing the PDFs")
+    parser.add_argument("labels", help="CSV with filename and label (include/exclude) columns")
+    parser.add_argument("--criteria", required=True, help="Inclusion criteria / research question")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated subset of "
+                        + ", ".join(BACKENDS))
+    parser.add_argument("--output", default="evaluation_report.json")
+    parser.add_argument("--chroma-path", default="./chroma_db")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Extraction processes")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent requests per backend")
+    parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"Unknown backends: {', '.join(sorted(unknown))}")
+
+    summary = evaluate(args.folder, args.labels, args.criteria, backends, args.output,
+                       chroma_path=args.chroma_path, workers=args.workers,
+                       concurrency=args.concurrency, context_tokens=args.context_tokens)
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
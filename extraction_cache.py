@@ -0,0 +1,203 @@
+import os
+import io
+import hashlib
+import tempfile
+import threading
+
+from metrics import get_metrics, EXTRACTION_CACHE_LOOKUPS
+
+DEFAULT_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", ".extraction_cache")
+DEFAULT_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024")) * 1024 * 1024
+EVICT_TO = 0.9  # Eviction frees down to this share of max_bytes, so the next writes do not evict again
+# Pages are separated by a form feed on its own line, so page counts survive extraction
+PAGE_BREAK = "\n\f\n"
+
+
+def _join_pages(pages):
+    text = PAGE_BREAK.join(page.strip() for page in pages)
+    return text if text.strip() else ""
+
+
+# PyPDF2 text, one page per line block (used by the LLM_*.py scripts)
+def _extract_pypdf2(pdf_bytes):
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    return _join_pages(page.extract_text() or "" for page in pdf_reader.pages)
+
+
+# PyMuPDF text blocks sorted by position (used by Approach_2/app.py)
+def _extract_pymupdf_blocks(pdf_bytes):
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    pages = []
+    for page in doc:
+        blocks = page.get_text("blocks")
+        # Sort by Y, then X position
+        pages.append("".join(block[4] + "\n" for block in sorted(blocks, key=lambda b: (b[1], b[0]))))
+    return _join_pages(pages)
+
+
+# name -> (version, function). Bump the version whenever an extractor's output changes.
+EXTRACTORS = {
+    "pypdf2": ("2", _extract_pypdf2),
+    "pymupdf_blocks": ("2", _extract_pymupdf_blocks),
+}
+
+
+class ExtractionCache:
+    """
+    On-disk text cache keyed by PDF content hash, extractor name and version, with LRU eviction.
+    Entry count and size are kept as running totals (from one directory walk on first use),
+    so writes only walk the cache when it has grown past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._totals = None  # [entries, bytes]; None until first needed
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(pdf_bytes, extractor):
+        version, _ = EXTRACTORS[extractor]
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        return f"{digest}-{extractor}-v{version}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return text
+
+    def put(self, key, text, evict=True):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode("utf-8")
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = None
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # Atomic, so concurrent readers never see partial files
+        with self._lock:
+            if self._totals is not None:
+                self._totals[0] += replaced is None
+                self._totals[1] += len(data) - (replaced or 0)
+        if evict and self._current_totals()[1] > self.max_bytes:
+            self.evict()
+
+    def record(self, hit):
+        get_metrics().inc(EXTRACTION_CACHE_LOOKUPS, result="hit" if hit else "miss")
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".txt"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    # Running (entries, bytes), walking the cache directory the first time
+    def _current_totals(self):
+        with self._lock:
+            if self._totals is None:
+                entries = self._entries()
+                self._totals = [len(entries), sum(size for _, size, _ in entries)]
+            return tuple(self._totals)
+
+    # Once over max_bytes, remove least recently used entries down to EVICT_TO of it. Always walks
+    # the directory, which also picks up entries written by other processes (extraction workers).
+    def evict(self):
+        entries = self._entries()
+        count, total = len(entries), sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO if total > self.max_bytes else self.max_bytes
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                count -= 1
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._totals = [count, total]
+
+    def stats(self):
+        count, total = self._current_totals()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache()
+        return _default_cache
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):  # Streamlit UploadedFile / BytesIO
+        return source.getvalue()
+    if hasattr(source, "read"):
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+# Extract text from a path, bytes or uploaded file, returning (text, cache_hit)
+def extract_with_cache(source, extractor="pypdf2", cache=None, evict=True):
+    cache = cache or get_default_cache()
+    pdf_bytes = _read_bytes(source)
+    key = ExtractionCache.key(pdf_bytes, extractor)
+    text = cache.get(key)
+    if text is not None:
+        cache.record(True)
+        return text, True
+    _, extract = EXTRACTORS[extractor]
+    text = extract(pdf_bytes)
+    cache.put(key, text, evict=evict)
+    cache.record(False)
+    return text, False
+
+
+def cached_extract(source, extractor="pypdf2", cache=None):
+    return extract_with_cache(source, extractor, cache)[0]
@@ -0,0 +1,75 @@
+import os
+
+from bm25_index import index_for
+from chunking import aggregate_by_paper, DEFAULT_OVERSAMPLE
+from collection_ops import scan
+from metrics import timed
+
+DEFAULT_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+DEFAULT_BM25_WEIGHT = float(os.getenv("HYBRID_BM25_WEIGHT", "1.0"))
+RRF_K = 60  # Standard reciprocal-rank-fusion constant; damps the gap between the very top ranks
+
+
+# Reciprocal-rank fusion of several ranked id lists: {id: sum(weight / (k + rank))}
+def fuse_rankings(rankings, weights, k=RRF_K):
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + weight / (k + rank)
+    return scores
+
+
+# Index every chunk already in the collection (e.g. stored before the BM25 index existed)
+def rebuild_index(collection, page_size=500):
+    index = index_for(collection)
+    index.clear()
+    for page in scan(collection, include=("documents", "metadatas"), page_size=page_size):
+        index.add(page["ids"], [doc or "" for doc in page["documents"]], page["metadatas"])
+    return index
+
+
+@timed("retrieve_hybrid")
+def hybrid_query_papers(collection, query_text, query_embedding, top_k=10, chunks_per_paper=3,
+                        oversample=DEFAULT_OVERSAMPLE, vector_weight=DEFAULT_VECTOR_WEIGHT,
+                        bm25_weight=DEFAULT_BM25_WEIGHT, where=None):
+    """
+    Same output as query_papers, but chunk candidates come from both the vector query and
+    the BM25 index and are ranked by weighted reciprocal-rank fusion. A bm25_weight of 0
+    gives plain vector retrieval; a vector_weight of 0 gives plain keyword retrieval.
+    A `where` metadata filter applies to both: keyword hits outside it are dropped.
+    """
+    total = collection.count()
+    if not total:
+        return []
+    n_results = max(1, min(top_k * oversample, total))
+    index = index_for(collection)
+    if bm25_weight and index.count() == 0:
+        index = rebuild_index(collection)
+
+    records = {}
+    vector_ranking, bm25_ranking = [], []
+    if vector_weight:
+        results = collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where)
+        for record_id, doc, meta in zip(results["ids"][0], results["documents"][0], results["metadatas"][0]):
+            records[record_id] = (doc, meta)
+            vector_ranking.append(record_id)
+    if bm25_weight:
+        bm25_ranking = [chunk_id for chunk_id, _ in index.search(query_text, n_results)]
+        missing = [chunk_id for chunk_id in bm25_ranking if chunk_id not in records]
+        if missing:
+            # Vector hits already passed `where`; keyword-only hits are checked here
+            fetched = collection.get(ids=missing, where=where, include=["documents", "metadatas"])
+            for record_id, doc, meta in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                records[record_id] = (doc, meta)
+        bm25_ranking = [chunk_id for chunk_id in bm25_ranking if chunk_id in records]  # Skip stale or filtered
+
+    scores = fuse_rankings([vector_ranking, bm25_ranking], [vector_weight, bm25_weight])
+    fused = sorted(scores, key=lambda record_id: -scores[record_id])
+    # aggregate_by_paper ranks by lowest distance, so the fused score goes in negated
+    fused_results = {
+        "ids": [fused],
+        "documents": [[records[record_id][0] for record_id in fused]],
+        "metadatas": [[records[record_id][1] for record_id in fused]],
+        "distances": [[-scores[record_id] for record_id in fused]],
+    }
+    return aggregate_by_paper(fused_results, top_k, chunks_per_paper)
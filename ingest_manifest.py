@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from chunking import delete_papers
+from pdf_ingestion import ingest_pdfs, list_pdfs, DEFAULT_WORKERS
+
+
+# Hash a file in 1 MB blocks so large PDFs are never fully loaded
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """JSON record of what is stored in a collection: id -> path, size, mtime, sha256."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.entries = {}
+
+
+def _stat_entry(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+
+
+# Work out which PDFs in folder_path are new, changed, unchanged or deleted
+def diff_folder(folder_path, manifest):
+    folder = os.path.abspath(folder_path)
+    current = {}
+    changes = {"new": [], "changed": [], "unchanged": [], "deleted": []}
+
+    for pdf_path in list_pdfs(folder_path):
+        doc_id = os.path.basename(pdf_path)
+        entry = _stat_entry(pdf_path)
+        current[doc_id] = entry
+        previous = manifest.entries.get(doc_id)
+        if previous is None:
+            entry["sha256"] = file_sha256(pdf_path)
+            changes["new"].append(doc_id)
+        elif previous["size"] == entry["size"] and previous["mtime"] == entry["mtime"]:
+            entry["sha256"] = previous["sha256"]  # Fast path: no need to re-read the file
+            changes["unchanged"].append(doc_id)
+        else:
+            entry["sha256"] = file_sha256(pdf_path)
+            if entry["sha256"] == previous["sha256"]:
+                changes["unchanged"].append(doc_id)  # Touched but identical bytes
+            else:
+                changes["changed"].append(doc_id)
+
+    # Only entries that came from this folder can have been deleted from it
+    for doc_id, previous in manifest.entries.items():
+        if doc_id not in current and os.path.dirname(previous["path"]) == folder:
+            changes["deleted"].append(doc_id)
+    return current, changes
+
+
+# A manifest entry for a file skipped as a copy of `original` remembers it, so the copy can stand in later
+def _with_original(entry, original):
+    return {**entry, "duplicate_of": original} if original else entry
+
+
+# True when the paper itself (not a skipped copy of another) is in the collection
+def _is_stored(manifest, doc_id):
+    entry = manifest.entries.get(doc_id)
+    return entry is not None and "duplicate_of" not in entry
+
+
+# Bring a collection in line with a folder, extracting and embedding only new or changed PDFs
+def sync_folder(folder_path, collection, manifest_path, metadata_key="filename",
+                workers=DEFAULT_WORKERS, skip_duplicates=False, **ingest_kwargs):
+    manifest = IngestManifest(manifest_path)
+    if manifest.entries and collection.count() == 0:
+        manifest.clear()  # The collection was dropped behind our back; start over
+
+    current, changes = diff_folder(folder_path, manifest)
+
+    stale_ids = changes["changed"] + changes["deleted"]
+    if stale_ids:
+        delete_papers(collection, stale_ids)
+    for doc_id in stale_ids:
+        manifest.entries.pop(doc_id, None)  # Changed files are recorded again once re-ingested
+
+    # Copies skipped in favour of a paper that is no longer stored are ingested again
+    requeued = [doc_id for doc_id in changes["unchanged"]
+                if "duplicate_of" in manifest.entries[doc_id]
+                and not _is_stored(manifest, manifest.entries[doc_id]["duplicate_of"])]
+    unchanged = [doc_id for doc_id in changes["unchanged"] if doc_id not in requeued]
+    for doc_id in unchanged:  # Refresh mtime for touched files
+        manifest.entries[doc_id] = _with_original(current[doc_id], manifest.entries[doc_id].get("duplicate_of"))
+
+    to_ingest = changes["new"] + changes["changed"] + requeued
+    duplicates = []
+    if skip_duplicates:
+        stored_hashes = {entry["sha256"]: doc_id for doc_id, entry in manifest.entries.items()
+                         if "duplicate_of" not in entry}
+        unique = []
+        for doc_id in to_ingest:
+            original = stored_hashes.get(current[doc_id]["sha256"])
+            if original is not None:
+                duplicates.append(doc_id)
+                manifest.entries[doc_id] = _with_original(current[doc_id], original)
+            else:
+                stored_hashes[current[doc_id]["sha256"]] = doc_id
+                unique.append(doc_id)
+        to_ingest = unique
+
+    report = ingest_pdfs(
+        [current[doc_id]["path"] for doc_id in to_ingest], collection,
+        metadata_key=metadata_key, workers=workers, skip_duplicates=skip_duplicates,
+        **ingest_kwargs
+    )
+    # Skipped (empty) and duplicate-text files are remembered too so they are not
+    # re-extracted every sync; failed files are left out and retried next time.
+    for doc_id in report["added"] + report["skipped"]:
+        manifest.entries[doc_id] = current[doc_id]
+    for doc_id in report["duplicates"]:
+        manifest.entries[doc_id] = _with_original(current[doc_id], report["duplicate_of"].get(doc_id))
+    for doc_id in report["errors"]:
+        manifest.entries.pop(doc_id, None)
+    manifest.save()
+
+    report["new"] = [doc_id for doc_id in changes["new"] if doc_id in report["added"]]
+    report["updated"] = [doc_id for doc_id in changes["changed"] if doc_id in report["added"]]
+    report["removed"] = changes["deleted"]
+    report["restored"] = [doc_id for doc_id in requeued if doc_id in report["added"]]
+    report["unchanged"] = unchanged
+    report["duplicates"] = duplicates + report["duplicates"]
+    return report
@@ -0,0 +1,138 @@
+import re
+from collections import deque
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Suffixes stripped by stem(), longest first: (suffix, replacement)
+_SUFFIXES = [("ational", "ate"), ("ations", "ate"), ("ation", "ate"), ("ies", "y"),
+             ("sses", "ss"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")]
+
+
+# Very small suffix-stripping stemmer: "therapies" -> "therapy", "dementias" -> "dementia"
+def stem(word):
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix == "s" and word.endswith(("ss", "us", "is")):
+                return word
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over all exclusion criteria, so each document is scanned once
+    no matter how many criteria there are. With word_boundaries the automaton runs over
+    word tokens (optionally stemmed) instead of characters, so "art" does not match "heart".
+    """
+
+    def __init__(self, criteria, word_boundaries=True, stemming=True):
+        self.criteria = list(dict.fromkeys(c.strip() for c in criteria if c.strip()))
+        self.word_boundaries = word_boundaries
+        self.stemming = stemming and word_boundaries
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, criterion in enumerate(self.criteria):
+            self._insert(self._symbols(criterion), index)
+        self._build_failure_links()
+
+    def _symbols(self, text):
+        text = text.lower()
+        if not self.word_boundaries:
+            return text
+        tokens = _TOKEN_RE.findall(text)
+        return [stem(token) for token in tokens] if self.stemming else tokens
+
+    def _insert(self, symbols, index):
+        if not symbols:
+            return
+        node = 0
+        for symbol in symbols:
+            if symbol not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][symbol] = len(self._goto) - 1
+            node = self._goto[node][symbol]
+        self._output[node].append(index)
+
+    def _build_failure_links(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for symbol, child in self._goto[node].items():
+                pending.append(child)
+                fallback = self._fail[node]
+                while fallback and symbol not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(symbol, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    # Count how often each criterion occurs in one document, in a single pass.
+    # Matches ending inside the first `skip` symbols are ignored.
+    def count(self, text, skip=0):
+        counts = {}
+        node = 0
+        for position, symbol in enumerate(self._symbols(text or "")):
+            while node and symbol not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(symbol, 0)
+            if position < skip:
+                continue
+            for index in self._output[node]:
+                criterion = self.criteria[index]
+                counts[criterion] = counts.get(criterion, 0) + 1
+        return counts
+
+    # Count a chunk without re-counting matches that end in the words it shares with the previous chunk
+    def count_chunk(self, text, overlap_words=0):
+        skip = len(self._symbols(" ".join(text.split(" ")[:overlap_words]))) if overlap_words else 0
+        return self.count(text, skip)
+
+    # Chroma where_document filter matching every chunk that could contain a criterion (and more),
+    # so only those chunks are read back and counted. None when there are no criteria.
+    def document_filter(self):
+        fragments = set()
+        for criterion in self.criteria:
+            if not self.word_boundaries:
+                fragments.add(criterion.lower())
+                continue
+            # Any word that stems to s starts with s minus the suffix stem() may have put back
+            roots = [re.sub(r"(?:y|ate)$", "", token) if self.stemming else token
+                     for token in self._symbols(criterion)]
+            if roots:
+                fragments.add(max(roots, key=len))
+        if not fragments:
+            return None
+        return {"$regex": "(?i)" + "|".join(re.escape(fragment) for fragment in sorted(fragments))}
+
+    # Per-document x per-criterion hit matrix: {doc_id: {criterion: count}} (only non-zero hits)
+    def match(self, documents):
+        return {doc_id: self.count(text) for doc_id, text in documents.items()}
+
+
+# Parse a comma-separated criteria string from the UI, dropping repeats (first occurrence kept)
+def parse_criteria(criteria_text):
+    return list(dict.fromkeys(criterion.strip() for criterion in criteria_text.split(",") if criterion.strip()))
+
+
+# Document IDs hit by at least one criterion
+def matched_ids(hit_matrix):
+    return [doc_id for doc_id, hits in hit_matrix.items() if hits]
+
+
+# Number of documents each criterion matched, for tuning the exclusion list
+def criterion_totals(hit_matrix, criteria):
+    totals = {criterion: 0 for criterion in criteria}
+    for hits in hit_matrix.values():
+        for criterion in hits:
+            totals[criterion] += 1
+    return totals
+
+
+# Hit matrix as a DataFrame (rows: documents with hits, columns: criteria)
+def hit_matrix_frame(hit_matrix, criteria):
+    import pandas as pd
+    rows = {doc_id: hits for doc_id, hits in hit_matrix.items() if hits}
+    frame = pd.DataFrame.from_dict(rows, orient="index", columns=list(criteria))
+    return frame.fillna(0).astype(int)
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from metrics import get_metrics, LLM_CACHE_LOOKUPS
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+DEFAULT_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+
+
+# Collapse whitespace so re-indented prompts (e.g. f-string templates) hash the same
+def normalize_prompt(text):
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of LLM responses keyed by model, normalized prompt hash and
+    generation parameters, with TTL expiry and LRU eviction beyond max_entries.
+    Set bypass (or LLM_CACHE_BYPASS=1) to always call the model.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, bypass=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bypass = os.getenv("LLM_CACHE_BYPASS") == "1" if bypass is None else bypass
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model, messages, params=None):
+        payload = {
+            "model": model,
+            "messages": [{"role": m.get("role"), "content": normalize_prompt(m.get("content"))} for m in messages],
+            "params": params or {},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created = row
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return response
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    # Return the cached response for this request, or call_fn() and cache its (string) result.
+    # With validate, responses it rejects (e.g. answers that do not parse) are never stored or served.
+    def cached(self, model, messages, call_fn, params=None, bypass=None, validate=None):
+        if self.bypass if bypass is None else bypass:
+            with self._lock:
+                self.bypassed += 1
+            get_metrics().inc(LLM_CACHE_LOOKUPS, result="bypass")
+            return call_fn()
+        key = self.key(model, messages, params)
+        response = self.get(key)
+        if response is not None and (validate is None or validate(response)):
+            with self._lock:
+                self.hits += 1
+            get_metrics().inc(LLM_CACHE_LOOKUPS, result="hit")
+            return response
+        with self._lock:
+            self.misses += 1
+        get_metrics().inc(LLM_CACHE_LOOKUPS, result="miss")
+        response = call_fn()
+        if response and (validate is None or validate(response)):
+            self.put(key, model, response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
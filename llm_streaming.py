@@ -0,0 +1,68 @@
+import time
+import logging
+
+from context_packer import count_tokens
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+CURSOR = "▌"
+
+
+# Text deltas from a legacy openai.ChatCompletion stream
+def stream_openai(model, messages, **params):
+    import openai
+    for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True, **params):
+        content = chunk["choices"][0].get("delta", {}).get("content")
+        if content:
+            yield content
+
+
+# Text deltas from ollama chat(stream=True) through an OllamaModelManager's persistent client
+def stream_ollama(manager, messages, **params):
+    for chunk in manager.chat(messages, stream=True, **params):
+        content = chunk["message"]["content"]
+        if content:
+            yield content
+
+
+# Text deltas from a litellm completion(stream=True), e.g. Gemini
+def stream_litellm(model, messages, **params):
+    from litellm import completion
+    for chunk in completion(model=model, messages=messages, stream=True, **params):
+        content = chunk.choices[0].delta.content
+        if content:
+            yield content
+
+
+# Write deltas to a Streamlit placeholder as they arrive; returns (text, timings)
+def render_stream(deltas, placeholder, suffix="", model=None, messages=None):
+    """
+    timings holds time to first token and total generation time in seconds, measured from
+    the call, since the first token is what the user perceives as the response time.
+    With a model the call is also recorded in the metrics; streamed responses carry no
+    usage, so token counts are estimated from the messages and the text.
+    """
+    start = time.perf_counter()
+    first_token = None
+    parts = []
+    for delta in deltas:
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        parts.append(delta)
+        placeholder.markdown("".join(parts) + CURSOR)
+    text = "".join(parts).strip()
+    placeholder.markdown(text + suffix)
+    timings = {"ttft": first_token if first_token is not None else time.perf_counter() - start,
+               "total": time.perf_counter() - start, "chunks": len(parts)}
+    logger.info(f"Streamed {timings['chunks']} chunks: first token after {timings['ttft']:.2f}s, "
+                f"done after {timings['total']:.2f}s")
+    if model is not None:
+        tokens_in = sum(count_tokens(message["content"], model) for message in messages or [])
+        get_metrics().record_llm_call(model, timings["total"], tokens_in, count_tokens(text, model),
+                                      ttft=timings["ttft"], stream=True)
+    return text, timings
+
+
+def format_timings(timings):
+    return f"First token after {timings['ttft']:.2f}s, full response after {timings['total']:.2f}s"
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import bisect
+import tempfile
+import functools
+import threading
+from contextlib import contextmanager
+
+# Each timed stage and LLM call is appended here as one JSON line; unset disables the log
+METRICS_JSON_LOG = os.getenv("METRICS_JSON_LOG") or None
+# export() rewrites this file in the Prometheus text format (e.g. for node_exporter's textfile collector);
+# unset disables the export
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE") or None
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = "review_stage_seconds"
+LLM_SECONDS = "review_llm_request_seconds"
+LLM_TTFT_SECONDS = "review_llm_time_to_first_token_seconds"
+LLM_REQUESTS = "review_llm_requests_total"
+LLM_TOKENS = "review_llm_tokens_total"
+LLM_RETRIES = "review_llm_retries_total"
+LLM_CACHE_LOOKUPS = "review_llm_cache_lookups_total"
+EXTRACTION_CACHE_LOOKUPS = "review_extraction_cache_lookups_total"
+SCREENING_BATCH_SPLITS = "review_screening_batch_splits_total"
+
+HELP = {
+    STAGE_SECONDS: "Wall time of a pipeline stage",
+    LLM_SECONDS: "Wall time of one LLM request",
+    LLM_TTFT_SECONDS: "Time to the first streamed token",
+    LLM_REQUESTS: "LLM requests sent",
+    LLM_TOKENS: "LLM tokens, by direction (in = prompt, out = completion)",
+    LLM_RETRIES: "LLM requests retried after a retryable error",
+    LLM_CACHE_LOOKUPS: "LLM response cache lookups, by result (hit, miss, bypass)",
+    EXTRACTION_CACHE_LOOKUPS: "PDF text extraction cache lookups, by result (hit, miss)",
+    SCREENING_BATCH_SPLITS: "Multi-paper screening batches re-sent after a malformed answer",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """Thread-safe counters and histograms, keyed by metric name and label values."""
+
+    def __init__(self, json_log=METRICS_JSON_LOG, buckets=DEFAULT_BUCKETS):
+        self.json_log = json_log
+        if json_log:
+            os.makedirs(os.path.dirname(os.path.abspath(json_log)), exist_ok=True)
+        self.buckets = tuple(buckets)
+        self.counters = {}    # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: {"buckets": [...], "sum": s, "count": n}}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            histogram = series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    # Append one structured event to the JSON log
+    def log(self, event, **fields):
+        if not self.json_log:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str)
+        with self._lock:
+            with open(self.json_log, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    # Time a pipeline stage; fields set on the yielded dict (e.g. item counts) go into the log line
+    @contextmanager
+    def timer(self, stage, **labels):
+        fields = {}
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(STAGE_SECONDS, seconds, stage=stage, **labels)
+            self.log("stage", stage=stage, seconds=round(seconds, 4), **labels, **fields)
+
+    def record_llm_call(self, model, seconds, tokens_in=0, tokens_out=0, ttft=None, **fields):
+        self.inc(LLM_REQUESTS, model=model)
+        self.inc(LLM_TOKENS, tokens_in or 0, model=model, direction="in")
+        self.inc(LLM_TOKENS, tokens_out or 0, model=model, direction="out")
+        self.observe(LLM_SECONDS, seconds, model=model)
+        if ttft is not None:
+            self.observe(LLM_TTFT_SECONDS, ttft, model=model)
+        self.log("llm_call", model=model, seconds=round(seconds, 4), tokens_in=tokens_in,
+                 tokens_out=tokens_out, ttft=None if ttft is None else round(ttft, 4), **fields)
+
+    # Per-stage calls, total and mean seconds, for the Streamlit timing panel
+    def stage_summary(self):
+        with self._lock:
+            series = dict(self.histograms.get(STAGE_SECONDS, {}))
+        rows = []
+        for key, histogram in sorted(series.items(), key=lambda item: -item[1]["sum"]):
+            labels = dict(key)
+            rows.append({"stage": labels.pop("stage"), **labels, "calls": histogram["count"],
+                         "total_s": round(histogram["sum"], 3),
+                         "mean_s": round(histogram["sum"] / histogram["count"], 3)})
+        return rows
+
+    def counter_total(self, name, **labels):
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for key, value in self.counters.get(name, {}).items() if wanted <= set(key))
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+                lines += [f"{name}{_format_labels(key)} {value}" for key, value in sorted(series.items())]
+            for name, series in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    # Atomically rewrite the Prometheus text file
+    def export(self, path=METRICS_PROM_FILE):
+        if not path:
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_metrics():
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
+
+
+# Shortcut for get_metrics().timer(...)
+def stage_timer(stage, **labels):
+    return get_metrics().timer(stage, **labels)
+
+
+# Decorator for functions that are one stage from start to finish
+def timed(stage, **labels):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Prompt/completion token counts from an OpenAI/litellm response, or from an Ollama response
+def usage_tokens(response):
+    try:
+        usage = response["usage"]
+        return usage["prompt_tokens"], usage["completion_tokens"]
+    except (KeyError, TypeError):
+        pass
+    try:
+        return response.get("prompt_eval_count", 0), response.get("eval_count", 0)
+    except AttributeError:
+        return 0, 0
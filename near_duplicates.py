@@ -0,0 +1,191 @@
+import re
+import zlib
+import functools
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_WORDS = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# Hashed k-word shingles of a text, after case and punctuation folding
+def shingles(text, k=DEFAULT_SHINGLE_WORDS):
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    if len(tokens) < k:
+        return {zlib.crc32(" ".join(tokens).encode())} if tokens else set()
+    return {zlib.crc32(" ".join(tokens[i:i + k]).encode()) for i in range(len(tokens) - k + 1)}
+
+
+class MinHasher:
+    """MinHash signatures with num_perm random linear permutations of 32-bit shingle hashes."""
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, shingle_words=DEFAULT_SHINGLE_WORDS, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = np.fromiter(shingles(text, self.shingle_words), dtype=np.uint64)
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1)
+
+    # Signature of the union of several texts (e.g. the chunks of one paper)
+    @staticmethod
+    def merge(signature_a, signature_b):
+        return np.minimum(signature_a, signature_b)
+
+
+def jaccard_estimate(sig_a, sig_b):
+    return float(np.mean(sig_a == sig_b))
+
+
+# Missed duplicates cost far more than extra candidates, which are re-checked with jaccard_estimate
+FALSE_POSITIVE_WEIGHT = 0.02
+FALSE_NEGATIVE_WEIGHT = 0.98
+
+
+# Probability that a pair with Jaccard similarity s shares at least one band bucket
+def _candidate_probability(s, bands, rows):
+    return 1.0 - (1.0 - s ** rows) ** bands
+
+
+def _integrate(f, low, high, steps=200):
+    xs = np.linspace(low, high, steps + 1)
+    ys = f(xs)
+    return float(np.sum((ys[1:] + ys[:-1]) * np.diff(xs)) / 2)
+
+
+@functools.lru_cache(maxsize=None)
+def choose_bands(threshold, num_perm):
+    """
+    (bands, rows) minimising the weighted area of false positives below the threshold and
+    false negatives above it (as datasketch's _optimal_param does). The false-negative weight
+    puts the S-curve below the threshold: at 0.85, a pair at the threshold is a candidate
+    about 97% of the time instead of the ~60% of a curve centred on it.
+    """
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positives = _integrate(lambda s: _candidate_probability(s, bands, rows), 0.0, threshold)
+            false_negatives = _integrate(lambda s: 1.0 - _candidate_probability(s, bands, rows), threshold, 1.0)
+            error = FALSE_POSITIVE_WEIGHT * false_positives + FALSE_NEGATIVE_WEIGHT * false_negatives
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """
+    LSH index over MinHash signatures. Only documents sharing a band bucket are compared,
+    so finding duplicates is roughly linear in the number of documents instead of quadratic.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher(num_perm)
+        self.bands, self.rows = choose_bands(threshold, self.hasher.num_perm)
+        self._buckets = [{} for _ in range(self.bands)]
+        self.signatures = {}
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, doc_id, text=None, signature=None):
+        signature = self.hasher.signature(text) if signature is None else signature
+        self.signatures[doc_id] = signature
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(doc_id)
+        return signature
+
+    # Indexed documents whose estimated similarity to the text reaches the threshold
+    def query(self, text=None, signature=None):
+        signature = self.hasher.signature(text) if signature is None else signature
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        matches = []
+        for doc_id in candidates:
+            similarity = jaccard_estimate(signature, self.signatures[doc_id])
+            if similarity >= self.threshold:
+                matches.append((doc_id, similarity))
+        return sorted(matches, key=lambda match: -match[1])
+
+    # Return the best earlier match for a new document, or index it and return None
+    def match_or_add(self, doc_id, text):
+        signature = self.hasher.signature(text)
+        matches = self.query(signature=signature)
+        if matches:
+            return matches[0]
+        self.add(doc_id, signature=signature)
+        return None
+
+
+# Group near-duplicate documents into clusters, each with one canonical copy
+def find_near_duplicates(documents, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM,
+                         choose_canonical=None):
+    """
+    documents maps id -> text. choose_canonical picks the copy to keep from a list of ids;
+    by default the longest text wins (usually the most complete extraction), ties going to
+    the id seen first. Returns [{"canonical", "duplicates", "similarity"}] for clusters of 2+.
+    """
+    hasher = MinHasher(num_perm)
+    signatures = {doc_id: hasher.signature(text) for doc_id, text in documents.items()}
+    lengths = {doc_id: len(text or "") for doc_id, text in documents.items()}
+    return cluster_signatures(signatures, lengths, threshold, choose_canonical)
+
+
+# Same as find_near_duplicates, from precomputed signatures (e.g. merged per-chunk signatures)
+def cluster_signatures(signatures, lengths, threshold=DEFAULT_THRESHOLD, choose_canonical=None):
+    if not signatures:
+        return []
+    # Only the band layout is needed here, so the index's own hasher is never used
+    index = NearDuplicateIndex(threshold, num_perm=len(next(iter(signatures.values()))))
+    order = {doc_id: position for position, doc_id in enumerate(signatures)}
+    parent = {doc_id: doc_id for doc_id in signatures}
+
+    def find(doc_id):
+        while parent[doc_id] != doc_id:
+            parent[doc_id] = parent[parent[doc_id]]
+            doc_id = parent[doc_id]
+        return doc_id
+
+    for doc_id, signature in signatures.items():
+        for match_id, _ in index.query(signature=signature):
+            root_a, root_b = find(doc_id), find(match_id)
+            if root_a != root_b:
+                parent[max(root_a, root_b, key=order.get)] = min(root_a, root_b, key=order.get)
+        index.add(doc_id, signature=signature)
+
+    groups = {}
+    for doc_id in signatures:
+        groups.setdefault(find(doc_id), []).append(doc_id)
+
+    if choose_canonical is None:
+        def choose_canonical(ids):
+            return max(ids, key=lambda doc_id: (lengths[doc_id], -order[doc_id]))
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        canonical = choose_canonical(members)
+        duplicates = [doc_id for doc_id in members if doc_id != canonical]
+        clusters.append({
+            "canonical": canonical,
+            "duplicates": duplicates,
+            "similarity": {
+                doc_id: jaccard_estimate(signatures[doc_id], signatures[canonical])
+                for doc_id in duplicates
+            },
+        })
+    return clusters
@@ -0,0 +1,86 @@
+import os
+import time
+import logging
+import threading
+
+import ollama
+
+logger = logging.getLogger(__name__)
+
+# Point OLLAMA_HOST at a stub server to exercise the manager without a real model
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # How long the model stays loaded after a request
+WARMUP_PROMPT = "Reply with the single word OK."
+
+
+# "llama3" and "llama3:latest" name the same model
+def _full_name(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaModelManager:
+    """
+    One persistent Ollama client per host. ready() pulls the model if it is missing, loads it
+    with keep_alive and answers a warm-up prompt, once; afterwards chat() is pure inference.
+    """
+
+    def __init__(self, model=OLLAMA_MODEL, host=OLLAMA_HOST, keep_alive=OLLAMA_KEEP_ALIVE):
+        self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.client = ollama.Client(host=host)
+        self.status = None
+        self._lock = threading.Lock()
+
+    def installed_models(self):
+        response = self.client.list()
+        return {_full_name(m.get("model") or m.get("name")) for m in response["models"]}
+
+    # Pull the model only when the server does not have it yet
+    def ensure_model(self):
+        if _full_name(self.model) in self.installed_models():
+            return False
+        logger.info(f"Pulling {self.model} from the Ollama registry...")
+        self.client.pull(self.model)
+        return True
+
+    # An empty prompt loads the model into memory without generating anything
+    def preload(self):
+        self.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+
+    def health_check(self):
+        start = time.perf_counter()
+        response = self.client.chat(model=self.model, messages=[{"role": "user", "content": WARMUP_PROMPT}],
+                                    options={"num_predict": 4}, keep_alive=self.keep_alive)
+        return {"ok": bool(response["message"]["content"].strip()), "latency": time.perf_counter() - start}
+
+    # Pull, preload and warm up once; later calls return the cached status
+    def ready(self):
+        with self._lock:
+            if self.status is None or not self.status["ok"]:
+                start = time.perf_counter()
+                pulled = self.ensure_model()
+                self.preload()
+                health = self.health_check()
+                self.status = {"model": self.model, "host": self.host, "pulled": pulled,
+                               "ok": health["ok"], "warmup_latency": health["latency"],
+                               "startup_time": time.perf_counter() - start}
+                logger.info(f"Ollama model ready: {self.status}")
+            return self.status
+
+    def chat(self, messages, stream=False, **params):
+        return self.client.chat(model=self.model, messages=messages, stream=stream,
+                                keep_alive=self.keep_alive, **params)
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+
+def get_model_manager():
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = OllamaModelManager()
+        return _default_manager
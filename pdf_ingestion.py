@@ -0,0 +1,228 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from bibliographic import paper_records, extract_bibliographic
+from extraction_cache import ExtractionCache, extract_with_cache, get_default_cache
+from metrics import stage_timer
+from bm25_index import index_for
+from chunking import delete_papers
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_MAX_WRITE_BATCH = 5000  # Used when the client cannot report its own limit
+
+_DONE = object()  # End-of-stream marker passed between the pipeline stages
+
+
+# Extract text from a PDF through the shared extraction cache (runs inside a worker process)
+def extract_text(pdf_path, cache_dir, extractor="pypdf2"):
+    # Eviction is left to the parent process so workers never race over the LRU order
+    return extract_with_cache(pdf_path, extractor, ExtractionCache(cache_dir), evict=False)
+
+
+# List the PDFs in a folder, sorted so runs are reproducible
+def list_pdfs(folder_path):
+    return sorted(
+        os.path.join(folder_path, filename)
+        for filename in os.listdir(folder_path)
+        if filename.endswith(".pdf")
+    )
+
+
+def _extract_stage(pdf_paths, workers, queue_size, out_queue, cache, report):
+    """Extract text in a process pool, keeping at most queue_size files in flight."""
+    pending = {}
+    paths = iter(pdf_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for pdf_path in paths:
+                pending[executor.submit(extract_text, pdf_path, cache.cache_dir)] = pdf_path
+                if len(pending) >= queue_size:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path = pending.pop(future)
+                filename = os.path.basename(pdf_path)
+                try:
+                    text, hit = future.result()
+                except Exception as e:
+                    report["errors"][filename] = f"extraction failed: {e}"
+                    continue
+                cache.record(hit)
+                if not text:
+                    report["skipped"].append(filename)
+                    continue
+                out_queue.put((filename, text))  # Blocks while the embedder is behind
+
+
+# Consume a stage's input up to the end marker, passing each item to on_item
+def _drain(in_queue, on_item):
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            return
+        on_item(item)
+
+
+def _embed_stage(in_queue, out_queue, batch_size, embed_fn, skip_duplicates, metadata_key,
+                 chunking, report):
+    """Chunk extracted documents, group them into batches and embed each batch in one call."""
+    seen_texts = {}  # Text -> first file with it
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        filenames = []
+        ids, documents, metadatas = [], [], []
+        with stage_timer("chunk") as fields:
+            for filename, text in batch:
+                try:
+                    if chunking:
+                        chunk_ids, chunk_docs, chunk_metas = paper_records(filename, text, {metadata_key: filename})
+                    else:
+                        chunk_ids, chunk_docs, chunk_metas = [filename], [text], [
+                            {metadata_key: filename, "paper_id": filename, **extract_bibliographic(text, filename)}]
+                except Exception as e:
+                    report["errors"][filename] = f"chunking failed: {e}"
+                    continue
+                filenames.append(filename)
+                ids.extend(chunk_ids)
+                documents.extend(chunk_docs)
+                metadatas.extend(chunk_metas)
+            fields.update(papers=len(filenames), chunks=len(ids))
+        if not filenames:
+            batch.clear()
+            return
+        embeddings = None
+        if embed_fn is not None:
+            try:
+                embeddings = embed_fn(documents)
+            except Exception as e:
+                for filename in filenames:
+                    report["errors"][filename] = f"embedding failed: {e}"
+                batch.clear()
+                return
+        out_queue.put((filenames, ids, documents, metadatas, embeddings))
+        batch.clear()
+
+    finished = False
+    try:
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                finished = True
+                break
+            filename, text = item
+            if skip_duplicates:
+                if text in seen_texts:
+                    report["duplicates"].append(filename)
+                    report["duplicate_of"][filename] = seen_texts[text]
+                    continue
+                seen_texts[text] = filename
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except Exception as e:
+        # Fail the files in hand and the ones still coming, so the extractor never blocks on a full queue
+        def fail(item):
+            report["errors"][item[0]] = f"embedding stage failed: {e}"
+
+        for item in batch:
+            fail(item)
+        if not finished:
+            _drain(in_queue, fail)
+    finally:
+        out_queue.put(_DONE)
+
+
+# Largest number of records Chroma accepts in one add call
+def max_batch_size(collection):
+    try:
+        return collection._client.get_max_batch_size()
+    except AttributeError:
+        return DEFAULT_MAX_WRITE_BATCH
+
+
+def _write_stage(in_queue, collection, report):
+    """Single writer: bulk collection.add calls per batch, each within Chroma's max batch size."""
+    limit = max_batch_size(collection)
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            break
+        filenames, ids, documents, metadatas, embeddings = item
+        try:
+            with stage_timer("chroma_write") as fields:
+                fields["chunks"] = len(ids)
+                for start in range(0, len(ids), limit):
+                    end = start + limit
+                    kwargs = {"documents": documents[start:end], "metadatas": metadatas[start:end],
+                              "ids": ids[start:end]}
+                    if embeddings is not None:
+                        kwargs["embeddings"] = embeddings[start:end]
+                    collection.add(**kwargs)
+            with stage_timer("bm25_write"):
+                index_for(collection).add(ids, documents, metadatas)
+        except Exception as e:
+            try:
+                delete_papers(collection, filenames)  # Drop slices that did go in, so no paper is half-stored
+            except Exception:
+                pass
+            for filename in filenames:
+                report["errors"][filename] = f"write failed: {e}"
+            continue
+        report["added"].extend(filenames)
+        print(f"Added batch of {len(filenames)} PDFs ({len(ids)} chunks) to ChromaDB.")
+
+
+# Ingest PDFs with overlapping extract -> embed -> write stages
+def ingest_pdfs(pdf_paths, collection, metadata_key="filename", workers=DEFAULT_WORKERS,
+                batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+                embed_fn=None, skip_duplicates=False, cache=None, chunking=True):
+    """
+    Extraction runs in a pool of `workers` processes, embedding runs on batches of
+    `batch_size` documents and a single writer thread sends bulk collection.add calls.
+    The queues between stages hold at most `queue_size` items so memory stays bounded.
+    A failing file is recorded in report["errors"] and does not stop the run. With
+    skip_duplicates, report["duplicate_of"] maps each skipped copy to the file it repeats.
+    Extracted text goes through the shared extraction cache, so unchanged PDFs are never re-parsed.
+    With chunking, each paper is stored as overlapping section-labelled chunks that carry
+    its id in the "paper_id" metadata field; report["added"] lists paper ids.
+    Title, year, DOI, source database and page count go into every chunk's metadata so
+    they can be used in `where` filters (see bibliographic.py).
+    """
+    cache = cache or get_default_cache()
+    report = {"added": [], "skipped": [], "duplicates": [], "duplicate_of": {}, "errors": {}}
+    extracted = queue.Queue(maxsize=queue_size)
+    embedded = queue.Queue(maxsize=max(1, queue_size // batch_size))
+
+    embedder = threading.Thread(
+        target=_embed_stage,
+        args=(extracted, embedded, batch_size, embed_fn, skip_duplicates, metadata_key, chunking, report),
+        daemon=True,
+    )
+    writer = threading.Thread(
+        target=_write_stage, args=(embedded, collection, report), daemon=True
+    )
+    embedder.start()
+    writer.start()
+    with stage_timer("ingest") as fields:
+        try:
+            with stage_timer("extract") as extract_fields:
+                _extract_stage(pdf_paths, max(1, workers), queue_size, extracted, cache, report)
+                extract_fields["files"] = len(pdf_paths)
+        finally:
+            extracted.put(_DONE)
+            embedder.join()
+            writer.join()
+        fields.update(files=len(pdf_paths), added=len(report["added"]), errors=len(report["errors"]))
+    cache.evict()
+    report["cache"] = cache.stats()
+    return report
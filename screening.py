@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import openai
+
+from bibliographic import find_title, find_abstract
+from extraction_cache import PAGE_BREAK
+from llm_cache import get_llm_cache
+from metrics import get_metrics, usage_tokens, LLM_RETRIES
+
+# Point OPENAI_API_BASE at a local OpenAI-compatible server to run screening against a mock.
+SCREENING_MODEL = os.getenv("SCREENING_MODEL", "gpt-4o-mini")
+DEFAULT_CONCURRENCY = int(os.getenv("SCREENING_CONCURRENCY", "8"))
+DEFAULT_RPM = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+DEFAULT_TPM = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+MAX_RETRIES = 6
+COMPLETION_TOKEN_ALLOWANCE = 500  # Reserved per request for the model's answer
+
+# Cascade: a short title/abstract prompt first, full text only when that is not a confident exclusion.
+# TRIAGE_API_BASE can point the first pass at a local OpenAI-compatible server (e.g. Ollama's /v1).
+TRIAGE_MODEL = os.getenv("TRIAGE_MODEL", SCREENING_MODEL)
+TRIAGE_API_BASE = os.getenv("TRIAGE_API_BASE") or None
+TRIAGE_MAX_TOKENS = 150
+TRIAGE_FALLBACK_WORDS = 300  # First-page words used when no abstract heading is found
+# Title/abstract exclusions at or above this confidence are final
+DEFAULT_EXCLUDE_CONFIDENCE = float(os.getenv("CASCADE_EXCLUDE_CONFIDENCE", "0.8"))
+# Title/abstract inclusions at or above this confidence skip the full-text pass; unset = always verify
+DEFAULT_INCLUDE_CONFIDENCE = (float(os.environ["CASCADE_INCLUDE_CONFIDENCE"])
+                              if os.getenv("CASCADE_INCLUDE_CONFIDENCE") else None)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to `capacity`; acquire() blocks until enough are available."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.available = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)  # A single oversized request must still be able to go
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by all screening threads."""
+
+    def __init__(self, requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+# Rough token count (about 4 characters per token) used for rate limiting
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# HTTP status of an API error, if it has one
+def _status_of(error):
+    return getattr(error, "http_status", None) or getattr(error, "status_code", None)
+
+
+# 429s, 5xx responses and connection problems are worth retrying; bad requests are not
+def is_retryable(error):
+    status = _status_of(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("RateLimitError", "APIConnectionError", "Timeout",
+                                    "ServiceUnavailableError", "TryAgain")
+
+
+# Call fn(), retrying retryable errors with exponential backoff and full jitter
+def call_with_retry(fn, max_retries=MAX_RETRIES, base_delay=1.0, max_delay=60.0):
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            get_metrics().inc(LLM_RETRIES, error=type(e).__name__)
+            retry_after = (getattr(e, "headers", None) or {}).get("retry-after")
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            time.sleep(delay)
+
+
+def build_screening_messages(text, criteria):
+    return [{
+        "role": "system",
+        "content": "You are an AI assistant that extracts title and abstract from research papers and evaluates inclusion criteria."
+    }, {
+        "role": "user",
+        "content": f"Extract the title and abstract from the following research paper text. Then, analyze the full text to determine whether the paper meets the inclusion criteria.\n\n"
+                   f"Paper Text:\n{text}\n\n"
+                   f"Inclusion Criteria: {criteria}\n\n"
+                   f"Format your response as:\n"
+                   f"Title: <title>\n"
+                   f"Abstract: <abstract>\n"
+                   f"Decision: <Include/Exclude>\n"
+                   f"Reason: <brief reason>"
+    }]
+
+
+# Parse the "Title/Abstract/Decision/Reason" answer format
+def parse_screening_response(content):
+    title_match = re.search(r"(?i)Title:\s*(.+)", content)
+    abstract_match = re.search(r"(?i)Abstract:\s*(.+)", content, re.DOTALL)
+    decision_match = re.search(r"(?i)Decision:\s*(Include|Exclude)", content)
+    reason_match = re.search(r"(?i)Reason:\s*(.+)", content, re.DOTALL)
+
+    title = title_match.group(1).strip() if title_match else "Title not found"
+    abstract = abstract_match.group(1).strip() if abstract_match else "Abstract not found"
+    decision = decision_match.group(1) if decision_match else "Error"
+    reason = reason_match.group(1).strip() if reason_match else "No reason provided"
+    return title, abstract, decision, reason
+
+
+# One cached, rate-limited, retried chat completion; params go to the API and into the cache key.
+# Answers that fail `validate` are returned but not cached, so a retry asks the model again.
+def cached_completion(model, messages, limiter, cache, bypass_cache, step, allowance=COMPLETION_TOKEN_ALLOWANCE,
+                      validate=None, **params):
+    def call():
+        # Cache hits never reach this, so they cost no rate-limit budget
+        if limiter is not None:
+            limiter.acquire(estimate_tokens("".join(message["content"] for message in messages)) + allowance)
+        start = time.perf_counter()
+        response = call_with_retry(lambda: openai.ChatCompletion.create(model=model, messages=messages, **params))
+        get_metrics().record_llm_call(model, time.perf_counter() - start, *usage_tokens(response), step=step)
+        return response["choices"][0]["message"]["content"]
+
+    return (cache or get_llm_cache()).cached(model, messages, call, params=params or None, bypass=bypass_cache,
+                                             validate=validate)
+
+
+# Screen one paper: cached, rate-limited, retried, parsed. Raises once retries are exhausted.
+def screen_paper(text, criteria, limiter=None, model=SCREENING_MODEL, cache=None, bypass_cache=None):
+    messages = build_screening_messages(text, criteria)
+    content = cached_completion(model, messages, limiter, cache, bypass_cache, "screening",
+                                validate=lambda answer: parse_screening_response(answer)[2] != "Error")
+    return parse_screening_response(content)
+
+
+# Title and abstract parsed locally from the first page; None when there is nothing to triage on
+def triage_fields(text):
+    title = find_title(text) or ""
+    abstract = find_abstract(text) or " ".join(text.split(PAGE_BREAK, 1)[0].split()[:TRIAGE_FALLBACK_WORDS])
+    return (title, abstract) if abstract else None
+
+
+def build_triage_messages(title, abstract, criteria):
+    return [{
+        "role": "system",
+        "content": "You screen research papers for a systematic review using only their title and abstract."
+    }, {
+        "role": "user",
+        "content": f"Title: {title}\nAbstract: {abstract}\n\n"
+                   f"Inclusion Criteria: {criteria}\n\n"
+                   f"Answer Unsure if the title and abstract are not enough to decide.\n"
+                   f"Format your response as:\n"
+                   f"Decision: <Include/Exclude/Unsure>\n"
+                   f"Confidence: <0-100>\n"
+                   f"Reason: <brief reason>"
+    }]
+
+
+_TRIAGE_DECISION_RE = re.compile(r"(?i)Decision:\s*(Include|Exclude|Unsure)")
+
+
+# Parse the "Decision/Confidence/Reason" triage answer; confidence is returned as 0-1
+def parse_triage_response(content):
+    decision_match = _TRIAGE_DECISION_RE.search(content)
+    confidence_match = re.search(r"(?i)Confidence:\s*([\d.]+)", content)
+    reason_match = re.search(r"(?i)Reason:\s*(.+)", content, re.DOTALL)
+
+    decision = decision_match.group(1).capitalize() if decision_match else "Unsure"
+    try:
+        confidence = float(confidence_match.group(1)) if confidence_match else 0.0
+    except ValueError:
+        confidence = 0.0
+    confidence = confidence / 100 if confidence > 1 else confidence
+    reason = reason_match.group(1).strip() if reason_match else "No reason provided"
+    return decision, confidence, reason
+
+
+def triage_paper(title, abstract, criteria, limiter=None, model=TRIAGE_MODEL, cache=None, bypass_cache=None,
+                 api_base=TRIAGE_API_BASE):
+    messages = build_triage_messages(title, abstract, criteria)
+    params = {"max_tokens": TRIAGE_MAX_TOKENS}
+    if api_base:
+        params["api_base"] = api_base
+    content = cached_completion(model, messages, limiter, cache, bypass_cache, "triage", allowance=TRIAGE_MAX_TOKENS,
+                                validate=lambda answer: _TRIAGE_DECISION_RE.search(answer) is not None, **params)
+    return parse_triage_response(content)
+
+
+# Two-stage screening: title/abstract first, full text only for papers that survive it
+def screen_paper_cascade(text, criteria, limiter=None, model=SCREENING_MODEL, cache=None, bypass_cache=None,
+                         triage_model=TRIAGE_MODEL, triage_api_base=TRIAGE_API_BASE,
+                         exclude_confidence=DEFAULT_EXCLUDE_CONFIDENCE, include_confidence=DEFAULT_INCLUDE_CONFIDENCE):
+    """
+    Returns (title, abstract, decision, reason, stage), where stage is "title_abstract" when
+    the first pass settled the paper and "full_text" otherwise. Only confident exclusions (and,
+    with include_confidence set, confident inclusions) stop after the first pass; Unsure,
+    low-confidence and failed triage answers all go on to full-text screening.
+    """
+    fields = triage_fields(text)
+    if fields:
+        title, abstract = fields
+        try:
+            decision, confidence, reason = triage_paper(title, abstract, criteria, limiter, triage_model, cache,
+                                                        bypass_cache, triage_api_base)
+        except Exception:
+            decision, confidence = "Unsure", 0.0
+        if decision == "Exclude" and confidence >= exclude_confidence:
+            return title, abstract, decision, reason, "title_abstract"
+        if decision == "Include" and include_confidence is not None and confidence >= include_confidence:
+            return title, abstract, decision, reason, "title_abstract"
+    return (*screen_paper(text, criteria, limiter, model, cache, bypass_cache), "full_text")
+
+
+# Screen many papers concurrently, yielding (key, result, error) as each one completes
+def screen_papers(papers, criteria, concurrency=DEFAULT_CONCURRENCY, limiter=None, model=SCREENING_MODEL,
+                  bypass_cache=None, cascade=None):
+    """
+    papers is an iterable of (key, text). At most `concurrency` requests are in flight and all
+    of them share one RateLimiter, so results can be shown as they arrive without tripping 429s.
+    With cascade (a dict of screen_paper_cascade keyword arguments, {} for the defaults) each
+    result is a 5-tuple ending in the stage that decided the paper.
+    """
+    limiter = limiter or RateLimiter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        if cascade is None:
+            futures = {
+                executor.submit(screen_paper, text, criteria, limiter, model, None, bypass_cache): key
+                for key, text in papers
+            }
+        else:
+            futures = {
+                executor.submit(screen_paper_cascade, text, criteria, limiter, model, None, bypass_cache,
+                                **cascade): key
+                for key, text in papers
+            }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e